@@ -1,7 +1,22 @@
-from .llcp import LLCP
+from .llcp import LLCP, TransitionFamily
+from .lump import LumpedTransition
 from .sample import NextReaction, NextReactionRecord, FirstReaction
-from .runner import RunnerFSM
+from .sample import PairingHeapQueue, DirectMethod, CompositionRejection
+from .indexed_heap import IndexedHeap
+from .runner import RunnerFSM, ReplicateRunner
+from .buffered import BufferedRandom
+from .tauleap import TauLeaping
+from .ensemble import CompiledNet, LockstepEnsemble
+from .splitting import FixedEffortSplitting
+from .likelihood import LikelihoodEngine, TrajectoryRecord, record_trajectory
+from .distributions import Distribution
 from .distributions import ExponentialDistribution, WeibullDistribution
 from .distributions import GammaDistribution, UniformDistribution
 from .distributions import PiecewiseLinearDistribution, PiecewiseConstantDistribution
+from .distributions import TabulatedDistribution, tabulated
+from .distributions import LogLogisticDistribution, GaussianDistribution
+from .distributions import HistogramDistribution
+from .batch import ExponentialBatch, WeibullBatch, GammaBatch, MixedBatch
 from .point_process import poisson_point_process_2D, thomas_point_process_2D
+from .point_process import matern_point_process_2D, tiled_point_process_2D
+from .spatial import neighbor_pairs, BuildKernelSIR, BuildGridKernelSIR
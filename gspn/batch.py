@@ -0,0 +1,169 @@
+import logging
+import numpy as np
+import scipy.special
+from gspn.distributions import ExponentialDistribution, WeibullDistribution
+from gspn.distributions import GammaDistribution
+
+logger=logging.getLogger(__file__)
+
+
+class DistributionBatch(object):
+    """
+    Holds the parameters and enabling times of many distributions of
+    one family in NumPy arrays, indexed by an integer such as a
+    transition id. The methods sample, hazard_integral and
+    implicit_hazard_integral take an array of indices, and times
+    that are either scalars or arrays of the same shape, so that one
+    call evaluates every distribution in the index array.
+
+    Subclasses name their parameters in parameter_names and provide
+    static kernels, integrate(parameters..., te, t0, t1),
+    invert(parameters..., te, xa, t0) and log_hazard(parameters..., te, t),
+    which work on arrays.
+    """
+    parameter_names=()
+
+    def __init__(self, capacity):
+        self.te=np.zeros(capacity, dtype=np.double)
+        self.parameter=np.zeros((len(self.parameter_names), capacity),
+            dtype=np.double)
+
+    def set(self, idx, distribution):
+        """
+        Copy the parameters of a scalar distribution of this family.
+        """
+        for row, name in enumerate(self.parameter_names):
+            self.parameter[row, idx]=getattr(distribution, name)
+        self.te[idx]=distribution.te
+
+    def hazard_integral(self, idx, t0, t1):
+        return self.integrate(*self.parameter[:, idx], self.te[idx], t0, t1)
+
+    def implicit_hazard_integral(self, idx, xa, t0):
+        return self.invert(*self.parameter[:, idx], self.te[idx], xa, t0)
+
+    def sample(self, idx, now, rng):
+        """
+        Firing times given that none fired before now.
+        """
+        xa=rng.exponential(size=np.shape(idx))
+        return self.implicit_hazard_integral(idx, xa, now)
+
+
+class ExponentialBatch(DistributionBatch):
+    parameter_names=("lam",)
+
+    @staticmethod
+    def integrate(lam, te, t0, t1):
+        return lam*(t1-t0)
+
+    @staticmethod
+    def invert(lam, te, xa, t0):
+        return t0+xa/lam
+
+    @staticmethod
+    def log_hazard(lam, te, t):
+        return np.log(lam)+np.zeros(np.shape(t))
+
+
+class WeibullBatch(DistributionBatch):
+    """
+    The shift of WeibullDistribution only affects its sample method,
+    so it isn't stored here.
+    """
+    parameter_names=("lam", "k")
+
+    @staticmethod
+    def integrate(lam, k, te, t0, t1):
+        return (np.power(np.maximum(t1-te, 0)/lam, k)-
+            np.power(np.maximum(t0-te, 0)/lam, k))
+
+    @staticmethod
+    def invert(lam, k, te, xa, t0):
+        return te+lam*np.power(
+            xa+np.power(np.maximum(t0-te, 0)/lam, k), 1/k)
+
+    @staticmethod
+    def log_hazard(lam, k, te, t):
+        with np.errstate(divide="ignore"):
+            return np.log(k/lam)+(k-1)*np.log(np.maximum(t-te, 0)/lam)
+
+
+class GammaBatch(DistributionBatch):
+    parameter_names=("alpha", "beta")
+
+    @staticmethod
+    def integrate(alpha, beta, te, t0, t1):
+        return (np.log(scipy.special.gammaincc(alpha,
+            beta*np.maximum(t0-te, 0)))-
+            np.log(scipy.special.gammaincc(alpha,
+            beta*np.maximum(t1-te, 0))))
+
+    @staticmethod
+    def invert(alpha, beta, te, xa, t0):
+        survival=np.exp(-xa)*scipy.special.gammaincc(alpha,
+            beta*np.maximum(t0-te, 0))
+        return te+scipy.special.gammainccinv(alpha, survival)/beta
+
+    @staticmethod
+    def log_hazard(alpha, beta, te, t):
+        s=np.maximum(t-te, 0)
+        with np.errstate(divide="ignore"):
+            return (alpha*np.log(beta)+(alpha-1)*np.log(s)-beta*s-
+                scipy.special.gammaln(alpha)-
+                np.log(scipy.special.gammaincc(alpha, beta*s)))
+
+
+class MixedBatch(object):
+    """
+    Distributions of several families, indexed together. Each index
+    remembers its family, and each call is split by family, so
+    a sampler can, for instance, integrate the hazards of all the
+    transitions affected by a firing at once.
+    """
+    batch_classes={
+        ExponentialDistribution : ExponentialBatch,
+        WeibullDistribution : WeibullBatch,
+        GammaDistribution : GammaBatch
+        }
+
+    def __init__(self, capacity):
+        self.family=np.full(capacity, -1, dtype=np.int64)
+        self._code=dict()
+        self.batches=list()
+        for family, batch_class in self.batch_classes.items():
+            self._code[family]=len(self.batches)
+            self.batches.append(batch_class(capacity))
+
+    def set(self, idx, distribution):
+        if type(distribution) not in self._code:
+            raise TypeError(("MixedBatch has no batch for {0}, only for "+
+                "{1}").format(type(distribution).__name__,
+                ", ".join(f.__name__ for f in self.batch_classes)))
+        code=self._code[type(distribution)]
+        self.family[idx]=code
+        self.batches[code].set(idx, distribution)
+
+    def hazard_integral(self, idx, t0, t1):
+        return self._dispatch("hazard_integral", idx, t0, t1)
+
+    def implicit_hazard_integral(self, idx, xa, t0):
+        return self._dispatch("implicit_hazard_integral", idx, xa, t0)
+
+    def sample(self, idx, now, rng):
+        idx=np.asarray(idx)
+        xa=rng.exponential(size=idx.shape)
+        return self.implicit_hazard_integral(idx, xa, now)
+
+    def _dispatch(self, method, idx, a, b):
+        idx=np.asarray(idx)
+        a=np.broadcast_to(a, idx.shape)
+        b=np.broadcast_to(b, idx.shape)
+        result=np.empty(idx.shape, dtype=np.double)
+        family=self.family[idx]
+        for code, batch in enumerate(self.batches):
+            mask=family==code
+            if np.any(mask):
+                result[mask]=getattr(batch, method)(idx[mask],
+                    a[mask], b[mask])
+        return result
@@ -0,0 +1,53 @@
+import logging
+
+logger=logging.getLogger(__file__)
+
+
+class BufferedRandom(object):
+    """
+    Wraps a NumPy generator, either a RandomState or a Generator,
+    so that scalar uniform and exponential variates come from blocks
+    drawn ahead of time. Samplers draw one variate per event, and
+    NumPy's cost per call is far larger than its cost per variate,
+    so handing out entries of a block is much faster.
+
+    Uniforms and unit exponentials each have their own block, refilled
+    from the generator when it runs out, so the stream is the same
+    for the same seed and block size. Requests with a size argument,
+    and every other method of the generator, go straight to the
+    generator.
+    """
+    def __init__(self, rng, block=4096):
+        self.rng=rng
+        self.block=block
+        self._uniform=list()
+        self._uniform_idx=0
+        self._exponential=list()
+        self._exponential_idx=0
+
+    def uniform(self, low=0.0, high=1.0, size=None):
+        if size is not None:
+            return self.rng.uniform(low, high, size)
+        if self._uniform_idx==len(self._uniform):
+            self._uniform=self.rng.uniform(0, 1, self.block).tolist()
+            self._uniform_idx=0
+        u=self._uniform[self._uniform_idx]
+        self._uniform_idx+=1
+        return low+(high-low)*u
+
+    def exponential(self, scale=1.0, size=None):
+        if size is not None:
+            return self.rng.exponential(scale, size)
+        if self._exponential_idx==len(self._exponential):
+            self._exponential=self.rng.exponential(1.0, self.block).tolist()
+            self._exponential_idx=0
+        x=self._exponential[self._exponential_idx]
+        self._exponential_idx+=1
+        return scale*x
+
+    def __getattr__(self, name):
+        # Only called for names the wrapper lacks. Guard rng itself
+        # so that copying or unpickling doesn't recurse.
+        if name=="rng":
+            raise AttributeError(name)
+        return getattr(self.rng, name)
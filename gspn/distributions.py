@@ -1,4 +1,9 @@
+import bisect
+import collections
+import hashlib
 import logging
+import math
+import sys
 import numpy as np
 import scipy.stats
 
@@ -28,7 +33,44 @@ def anderson_sample_tester(distribution, now, cnt, rng):
     return samples
 
 
-class ExponentialDistribution(object):
+class Distribution(object):
+    """
+    Two distributions are equal when they are the same family, with
+    the same parameters and enabling time, so that their hazards
+    agree at all times. LLCP uses this to skip transitions whose
+    distribution didn't change when they were re-evaluated.
+    Subclasses return their parameters, without te, from parameters(),
+    and the hazard at absolute time t from hazard(t).
+    """
+    def parameters(self):
+        raise NotImplementedError()
+
+    def __eq__(self, other):
+        return (type(self) is type(other) and self.te==other.te and
+            self.parameters()==other.parameters())
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((type(self), self.te, self.parameters()))
+
+
+def _table_digest(*arrays):
+    """
+    Stands for the contents of tables in parameters(), computed once,
+    so comparing two distributions doesn't cost time in proportion
+    to the length of their tables.
+    """
+    digest=hashlib.sha1()
+    for a in arrays:
+        a=np.ascontiguousarray(a, dtype=np.double)
+        digest.update(np.int64(a.shape[0]).tobytes())
+        digest.update(a.tobytes())
+    return digest.digest()
+
+
+class ExponentialDistribution(Distribution):
     """
     This represents an exponential distribution.
     .. math::
@@ -39,9 +81,25 @@ class ExponentialDistribution(object):
         self.lam=lam
         self.te=te
 
+    def parameters(self):
+        return (self.lam,)
+
+    def __eq__(self, other):
+        """
+        The exponential is memoryless, so the enabling time
+        doesn't change its hazard.
+        """
+        return type(self) is type(other) and self.lam==other.lam
+
+    def __hash__(self):
+        return hash((type(self), self.lam))
+
     def sample(self, now, rng):
         return now+rng.exponential(scale=1.0/self.lam)
 
+    def hazard(self, t):
+        return self.lam
+
     def hazard_integral(self, t0, t1):
         return self.lam*(t1-t0)
 
@@ -49,13 +107,13 @@ class ExponentialDistribution(object):
         return t0+xa/self.lam
 
     def loglikelihood(self, t0, tf):
-        return -self.lam*(tf-t0)
+        return np.log(self.lam)-self.lam*(tf-t0)
 
     def enabling_time(self):
         return self.te
 
 
-class WeibullDistribution(object):
+class WeibullDistribution(Distribution):
     """
     This is a Weibull distribution.
     """
@@ -65,6 +123,9 @@ class WeibullDistribution(object):
         self.te=te
         self.delta=shift
 
+    def parameters(self):
+        return (self.lam, self.k, self.delta)
+
     def sample(self, now, rng):
         logger.debug("WeibullDistribution.sample l={0}, k={1}, te={2}".format(
             self.lam, self.k, self.te))
@@ -79,6 +140,11 @@ class WeibullDistribution(object):
             value=l*np.power(-np.log(1-U), 1/k)+self.te
         return now + value
 
+    def hazard(self, t):
+        if t<self.te:
+            return 0.0
+        return (self.k/self.lam)*np.power((t-self.te)/self.lam, self.k-1)
+
     def hazard_integral(self, t0, t1):
         logger.debug("WeibullDistribution.hazard l={0}, k={1}, te={2}".format(
             self.lam, self.k, self.te))
@@ -86,17 +152,27 @@ class WeibullDistribution(object):
             -np.power((t0-self.te)/self.lam, self.k) )
 
     def implicit_hazard_integral(self, xa, t0):
-        t1=t0 + self.lam * xa**(1/self.k)
+        t1=self.te + self.lam * np.power(
+            xa + np.power((t0-self.te)/self.lam, self.k), 1/self.k)
         logger.debug(("WeibullDistribution.implicit l={0}, k={1}, te={2} "+
             "xa={3} t0={4} t1={5}").format(
             self.lam, self.k, self.te, xa, t0, t1))
         return t1
 
+    def loglikelihood(self, t0, tf):
+        """
+        Log of the density of firing at tf, given no firing by t0.
+        """
+        hazard=self.hazard(tf)
+        if hazard<=0:
+            return -float("inf")
+        return np.log(hazard)-self.hazard_integral(max(t0, self.te), tf)
+
     def enabling_time(self):
         return self.te
 
 
-class GammaDistribution(object):
+class GammaDistribution(Distribution):
     """
     This is a gamma distribution with a shape and a rate,
     not a shape and a scale.
@@ -127,6 +203,9 @@ class GammaDistribution(object):
         self.beta=beta
         self.te=te
 
+    def parameters(self):
+        return (self.alpha, self.beta)
+
     def sample(self, now, rng):
         """
         Sampling accounts for time shift and uses given random
@@ -143,6 +222,14 @@ class GammaDistribution(object):
             return scipy.stats.gamma.isf(1-U,
                 self.alpha, scale=1.0/self.beta, loc=0) + self.te
 
+    def hazard(self, t):
+        s=t-self.te
+        if s<=0:
+            return 0.0
+        log_pdf=(self.alpha*np.log(self.beta)+(self.alpha-1)*np.log(s)-
+            self.beta*s-scipy.special.gammaln(self.alpha))
+        return np.exp(log_pdf)/scipy.special.gammaincc(self.alpha, self.beta*s)
+
     def hazard_integral(self, t0, t1):
         """
         Our tools include
@@ -152,30 +239,28 @@ class GammaDistribution(object):
          - gammaincc(a, x), 1-gammainc(a, x)
          - gammainccinv(a, y), gammaincc(a, x)=y
         """
-        return np.log(
-            (1-scipy.special.gammainc(self.alpha, self.beta*(t0-self.te)))/
-            (1-scipy.special.gammainc(self.alpha, self.beta*(t1-self.te)))
+        return (
+            np.log(scipy.special.gammaincc(self.alpha, self.beta*(t0-self.te)))-
+            np.log(scipy.special.gammaincc(self.alpha, self.beta*(t1-self.te)))
             )
 
     def implicit_hazard_integral(self, xa, t0):
-        quad=1-np.exp(-xa)*(1-scipy.special.gammainc(self.alpha,
-                self.beta*(t0-self.te)))
-        return self.te+scipy.special.gammaincinv(self.alpha, quad)/self.beta
+        survival=np.exp(-xa)*scipy.special.gammaincc(self.alpha,
+                self.beta*(t0-self.te))
+        return self.te+scipy.special.gammainccinv(self.alpha, survival)/self.beta
 
     def loglikelihood(self, t0, tf):
-        t0e=t0-self.te
-        logf=(np.log(np.power(self.beta, self.alpha)*
-            np.power(t0e, self.alpha-1))
-            -self.beta*t0e-scipy.special.gammaln(self.alpha))
-        integrated=self.hazard_integral(self.te, t0)
-        return logf + integrated
+        """
+        Log of the density of firing at tf, given no firing by t0.
+        """
+        return np.log(self.hazard(tf))-self.hazard_integral(t0, tf)
 
     def enabling_time(self):
         return self.te
 
 
 
-class UniformDistribution(object):
+class UniformDistribution(Distribution):
     """
     Uniform distribution between a and b, offset by an enabling time te.
     """
@@ -189,6 +274,9 @@ class UniformDistribution(object):
         self.b=b
         self.te=te
 
+    def parameters(self):
+        return (self.a, self.b)
+
     def sample(self, now, rng):
         """
         Sampling accounts for time shift and uses given random
@@ -201,6 +289,12 @@ class UniformDistribution(object):
         else:
             return np.float("nan")
 
+    def hazard(self, t):
+        s=t-self.te
+        if s<=self.a or s>=self.b:
+            return 0.0
+        return 1.0/(self.b-s)
+
     def hazard_integral(self, t0, t1):
         """
         Integrate the hazard, taking into account when the uniform
@@ -214,8 +308,8 @@ class UniformDistribution(object):
             return 0
         low=max(self.a, t0e)
         high=min(self.b, t1e)
-        numerator=np.log(1-(t0e-self.a)/(self.b-self.a))
-        denominator=np.log((self.b-t1e)/(self.b-self.a))
+        numerator=np.log((self.b-low)/(self.b-self.a))
+        denominator=np.log((self.b-high)/(self.b-self.a))
         return numerator-denominator
 
     def implicit_hazard_integral(self, xa, t0):
@@ -226,27 +320,222 @@ class UniformDistribution(object):
         return r
 
     def loglikelihood(self, t0, tf):
-        t0e=t0-self.te
+        """
+        Log of the density of firing at tf, given no firing by t0.
+        """
         tfe=tf-self.te
-        if tfe<self.a or te>=self.b:
-            return np.double("nan")
-        t0e=max(t0e, self.a)
-        ln_pdf=np.log((tf-self.a)/(self.b-self.a))
-        int_hazard=self.hazard_integral(self.te, t0)
-        return ln_pdf + int_hazard
+        if tfe<=self.a or tfe>=self.b:
+            return -float("inf")
+        return np.log(self.hazard(tf))-self.hazard_integral(t0, tf)
+
+    def enabling_time(self):
+        return self.te
+
+class LogLogisticDistribution(Distribution):
+    """
+    A log-logistic distribution with scale alpha and shape beta,
+    .. math::
+
+        S(t)=\\frac{1}{1+(t/\\alpha)^\\beta}
+
+    so the integrated hazard is log(1+(t/alpha)^beta) and
+    inverts in closed form.
+    """
+    def __init__(self, alpha, beta, te):
+        self.alpha=alpha
+        self.beta=beta
+        self.te=te
+
+    def parameters(self):
+        return (self.alpha, self.beta)
+
+    def _log_odds(self, t):
+        # Work with the log of the odds, (t/alpha)^beta, so that
+        # neither long times nor large intervals overflow.
+        s=t-self.te
+        if s<=0:
+            return -float("inf")
+        return self.beta*(math.log(s)-math.log(self.alpha))
+
+    def sample(self, now, rng):
+        return self.implicit_hazard_integral(-math.log(rng.uniform(0, 1)), now)
+
+    def hazard(self, t):
+        if t<=self.te:
+            return 0.0
+        return self.beta/(t-self.te)*scipy.special.expit(self._log_odds(t))
+
+    def hazard_integral(self, t0, t1):
+        return float(np.logaddexp(0, self._log_odds(t1))-
+            np.logaddexp(0, self._log_odds(t0)))
+
+    def implicit_hazard_integral(self, xa, t0):
+        # The new odds are odds e^xa+expm1(xa).
+        log_odds=self._log_odds(t0)
+        if xa>0:
+            if xa<1:
+                log_expm1=math.log(math.expm1(xa))
+            else:
+                log_expm1=xa+math.log1p(-math.exp(-xa))
+            log_odds=float(np.logaddexp(log_odds+xa, log_expm1))
+        exponent=math.log(self.alpha)+log_odds/self.beta
+        if exponent>=math.log(sys.float_info.max):
+            return float("inf")
+        return self.te+math.exp(exponent)
+
+    def loglikelihood(self, t0, tf):
+        """
+        Log of the density of firing at tf, given no firing by t0.
+        """
+        return math.log(self.hazard(tf))-self.hazard_integral(t0, tf)
+
+    def enabling_time(self):
+        return self.te
+
+
+class GaussianDistribution(Distribution):
+    """
+    A normal distribution of firing times, with mean mu and standard
+    deviation sigma after the enabling time, truncated so that it
+    cannot fire before it is enabled. The integrated hazard is minus
+    the log survival, computed with log_ndtr, and ndtri_exp inverts it
+    without losing precision far in the tail.
+    """
+    def __init__(self, mu, sigma, te):
+        self.mu=mu
+        self.sigma=sigma
+        self.te=te
+
+    def parameters(self):
+        return (self.mu, self.sigma)
+
+    def _log_survival(self, t):
+        return scipy.special.log_ndtr((self.mu-max(t-self.te, 0))/self.sigma)
+
+    def sample(self, now, rng):
+        return self.implicit_hazard_integral(-math.log(rng.uniform(0, 1)), now)
+
+    def _log_pdf(self, t):
+        z=(t-self.te-self.mu)/self.sigma
+        return -0.5*z*z-math.log(self.sigma*math.sqrt(2*math.pi))
+
+    def hazard(self, t):
+        if t<self.te:
+            return 0.0
+        return math.exp(self._log_pdf(t)-self._log_survival(t))
+
+    def hazard_integral(self, t0, t1):
+        return self._log_survival(t0)-self._log_survival(t1)
+
+    def implicit_hazard_integral(self, xa, t0):
+        z=scipy.special.ndtri_exp(self._log_survival(t0)-xa)
+        return self.te+self.mu-self.sigma*z
+
+    def loglikelihood(self, t0, tf):
+        """
+        Log of the density of firing at tf, given no firing by t0.
+        """
+        return self._log_pdf(tf)-self._log_survival(t0)
 
     def enabling_time(self):
         return self.te
 
-# LogLogistic
-# Gaussian
-# Histogram
+
+class HistogramDistribution(Distribution):
+    """
+    Firing times from a histogram. The density is constant within
+    each bin, proportional to its count, so the cumulative
+    distribution is piecewise linear. It is computed at the bin
+    edges once, so each call is a binary search and a
+    linear interpolation.
+    """
+    def __init__(self, edges, counts, te):
+        self.edges=np.array(edges, dtype=np.double)
+        self.counts=np.array(counts, dtype=np.double)
+        assert(self.edges.shape[0]==self.counts.shape[0]+1)
+        self.te=te
+        # Survival at each edge, from the top down, so that
+        # the far tail doesn't round to zero.
+        self.survival=np.zeros(self.edges.shape[0], dtype=np.double)
+        self.survival[:-1]=np.cumsum(self.counts[::-1])[::-1]/np.sum(self.counts)
+        self._digest=_table_digest(self.edges, self.counts)
+
+    def parameters(self):
+        return (self._digest,)
+
+    def _survival(self, t):
+        s=t-self.te
+        if s<=self.edges[0]:
+            return 1.0
+        if s>=self.edges[-1]:
+            return 0.0
+        idx=np.searchsorted(self.edges, s, side="right")-1
+        fraction=(s-self.edges[idx])/(self.edges[idx+1]-self.edges[idx])
+        return (self.survival[idx]+
+            fraction*(self.survival[idx+1]-self.survival[idx]))
+
+    def sample(self, now, rng):
+        return self.implicit_hazard_integral(-math.log(rng.uniform(0, 1)), now)
+
+    def _density(self, s):
+        if s<self.edges[0] or s>=self.edges[-1]:
+            return 0.0
+        idx=np.searchsorted(self.edges, s, side="right")-1
+        return ((self.survival[idx]-self.survival[idx+1])/
+            (self.edges[idx+1]-self.edges[idx]))
+
+    def hazard(self, t):
+        density=self._density(t-self.te)
+        if density<=0:
+            return 0.0
+        return density/self._survival(t)
+
+    def hazard_integral(self, t0, t1):
+        start=self._survival(t0)
+        end=self._survival(t1)
+        # Past the last nonempty bin the hazard is zero, but reaching
+        # it from within the support takes an infinite integral.
+        if end<=0:
+            return float("inf") if start>0 else 0.0
+        return math.log(start)-math.log(end)
+
+    def implicit_hazard_integral(self, xa, t0):
+        survival=self._survival(t0)
+        if survival<=0:
+            # Past the support the hazard is zero, so it never fires.
+            return float("inf")
+        target=survival*math.exp(-xa)
+        # Survival decreases along the edges, so search its negative.
+        idx=np.searchsorted(-self.survival, -target, side="right")-1
+        idx=min(idx, self.edges.shape[0]-2)
+        drop=self.survival[idx]-self.survival[idx+1]
+        if drop<=0:
+            return max(t0, self.te+self.edges[idx])
+        fraction=(self.survival[idx]-target)/drop
+        return max(t0, self.te+self.edges[idx]+fraction*(
+            self.edges[idx+1]-self.edges[idx]))
+
+    def loglikelihood(self, t0, tf):
+        """
+        Log of the density of firing at tf, given no firing by t0.
+        """
+        density=self._density(tf-self.te)
+        survival=self._survival(t0)
+        if density<=0 or survival<=0:
+            return -float("inf")
+        return math.log(density)-math.log(survival)
+
+    def enabling_time(self):
+        return self.te
 
 
-class PiecewiseLinearDistribution(object):
+class PiecewiseLinearDistribution(Distribution):
     """
     This is a piecewise linear hazard, not a piecewise linear probability.
     Whatever is the last point is treated as a horizontal line to infinity.
+    The integral of the hazard up to each point is computed once,
+    so that integrating or inverting the hazard is a binary search
+    followed by a closed-form solution within one segment.
     """
     def __init__(self, times, hazards, enabling_time):
         assert(times[0]<1e-6)
@@ -256,185 +545,296 @@ class PiecewiseLinearDistribution(object):
             self.b=np.hstack([self.b, float("inf")])
             self.w=np.hstack([self.w, self.w[-1]])
         self.te=enabling_time
-        self.wcopy=np.copy(self.w)
+        width=np.diff(self.b)
+        self.slope=np.zeros(self.b.shape[0], dtype=np.double)
+        self.slope[:-2]=np.diff(self.w[:-1])/width[:-1]
+        self.cumulative=np.zeros(self.b.shape[0], dtype=np.double)
+        self.cumulative[1:-1]=np.cumsum(0.5*width[:-1]*(self.w[:-2]+self.w[1:-1]))
+        self.cumulative[-1]=float("inf")
+        self._digest=_table_digest(self.b, self.w)
+
+    def parameters(self):
+        return (self._digest,)
 
     def sample(self, now, rng):
         """
         Sampling accounts for time shift and uses given random
         number generator.
         """
-        raise RuntimeError("Cannot sample this yet.")
+        return self.implicit_hazard_integral(-np.log(rng.uniform(0, 1)), now)
+
+    def _segment(self, s):
+        return max(np.searchsorted(self.b, s, side="right")-1, 0)
+
+    def _integral(self, s):
+        """
+        Integral of the hazard from the enabling time to s after it.
+        """
+        s=max(s, 0.0)
+        idx=self._segment(s)
+        d=s-self.b[idx]
+        return self.cumulative[idx]+d*(self.w[idx]+0.5*self.slope[idx]*d)
+
+    def hazard(self, t):
+        s=t-self.te
+        if s<0:
+            return 0.0
+        idx=self._segment(s)
+        return self.w[idx]+self.slope[idx]*(s-self.b[idx])
 
     def hazard_integral(self, t0, t1):
         """
         Integrate the hazard, taking into account when the uniform
         interval starts and stops.
         """
-        t0e=t0-self.te
-        t1e=t1-self.te
-        if t1e<self.b[0]:
-            return 0
-        # Take the array of hazards at times and chop it off
-        # on the left at t0e.
-        b, w=(np.copy(self.b), np.copy(self.w))
-        left=np.where(b<=t0e)[0][-1]
-        b=b[left:]
-        w=w[left:]
-        b[0]=t0e
-        # Chop off the right after t1e.
-        right=np.where(b<t1e)[0][-1]
-        b=b[:(right+1)]
-        w=w[:(right+1)]
-        # Add a point back for the end point.
-        b=np.hstack([ b, np.array([t1e])])
-        w=np.hstack([ w, np.array([w[-1]])])
-
-        total=0.0
-        for idx in range(b.shape[0]-1):
-            db=b[idx+1]-b[idx]
-            total+=0.5*db*(w[idx+1]+w[idx])
-        assert(np.all(self.w==self.wcopy))
-        return total
-
+        return self._integral(t1-self.te)-self._integral(t0-self.te)
 
     def implicit_hazard_integral(self, xa, t0):
-        t0e=t0-self.te
-        # Take the array of hazards at times and chop it off
-        # on the left at t0e.
-        b, w=(np.copy(self.b), np.copy(self.w))
-        left=np.where(b<=t0e)[0][-1]
-        b=b[left:]
-        w=w[left:]
-        b[0]=t0e
-        #logger.debug("Piecewise bleft {0} {1}".format(b, w))
-        b-=t0e   # Now it starts at 0.
-        #logger.debug("Piecewise bleft {0} {1}".format(b, w))
-
-        idx=0
-        t1e=0
-        # Each loop removes a chunk from the sum, xa.
-        while xa>0:
-            # Create a putative right-hand point, given the current
-            # slope, and see if it's before the right-hand point
-            # that starts the next segment.
-            if (w[idx]+w[idx+1])/xa > 1e-20:
-                t1e=b[idx]+2*xa/(w[idx]+w[idx+1])
-                # The last entry is infinity, so this is safe.
-                if t1e<b[idx+1]:
-                    xa=0
-                else:
-                    xa-=(b[idx+1]-b[idx])*0.5*(w[idx]+w[idx+1])
-            else:
-                if np.isinf(b[idx+1]):
-                    raise RuntimeError("Could not solve for t0 {0}".format(
-                        xa))
-                else:
-                    pass # Go to next entry in table.
-            idx+=1
-
-        assert(np.all(self.w==self.wcopy))
-        return t1e+t0
+        target=self._integral(t0-self.te)+xa
+        idx=np.searchsorted(self.cumulative, target, side="right")-1
+        if idx==self.b.shape[0]-2 and self.w[idx]<=0:
+            return float("inf")
+        remainder=target-self.cumulative[idx]
+        if remainder<=0:
+            return self.te+self.b[idx]
+        w=self.w[idx]
+        # Solve w*d+slope*d^2/2=remainder in a form that is stable
+        # when the slope is zero or negative.
+        d=2*remainder/(w+np.sqrt(max(w*w+2*self.slope[idx]*remainder, 0)))
+        return self.te+self.b[idx]+d
 
     def loglikelihood(self, t0, tf):
-        return None
- 
+        """
+        Log of the density of firing at tf, given no firing by t0.
+        """
+        return np.log(self.hazard(tf))-self.hazard_integral(t0, tf)
+
     def enabling_time(self):
         return self.te
 
-    
 
-class PiecewiseConstantDistribution(object):
+
+class PiecewiseConstantDistribution(Distribution):
     """
-    This is a piecewise linear hazard, not a piecewise linear probability.
+    This is a piecewise constant hazard, not a piecewise constant
+    probability. The hazard is hazards[i] from times[i] until
+    times[i+1], and the last hazard continues to infinity.
+    The integral of the hazard up to each time is computed once,
+    so that integrating or inverting the hazard is a binary search.
     """
     def __init__(self, times, hazards, enabling_time):
         assert(times[0]<1e-6)
-        self.b=times
-        self.w=hazards
+        self.b=np.array(times, dtype=np.double)
+        self.w=np.array(hazards, dtype=np.double)
         self.te=enabling_time
-        self.partial_sum=np.zeros((len(times),), dtype=np.double)
+        self.cumulative=np.zeros(self.b.shape[0], dtype=np.double)
+        self.cumulative[1:]=np.cumsum(self.w[:-1]*np.diff(self.b))
+        self._digest=_table_digest(self.b, self.w)
 
-        total=0
-        for idx in range(len(times)-1):
-            self.partial_sum[idx]=total
-            total+=0.5*(hazards[idx]+hazards[idx+1])*(times[idx+1]-times[idx])
-        self.partial_sum[len(times)-1]=total
+    def parameters(self):
+        return (self._digest,)
 
     def sample(self, now, rng):
         """
         Sampling accounts for time shift and uses given random
         number generator.
         """
-        raise RuntimeError("Cannot sample this yet.")
+        return self.implicit_hazard_integral(-np.log(rng.uniform(0, 1)), now)
+
+    def _segment(self, s):
+        return max(np.searchsorted(self.b, s, side="right")-1, 0)
+
+    def _integral(self, s):
+        """
+        Integral of the hazard from the enabling time to s after it.
+        """
+        s=max(s, 0.0)
+        idx=self._segment(s)
+        return self.cumulative[idx]+self.w[idx]*(s-self.b[idx])
+
+    def hazard(self, t):
+        s=t-self.te
+        if s<0:
+            return 0.0
+        return self.w[self._segment(s)]
 
     def hazard_integral(self, t0, t1):
         """
         Integrate the hazard, taking into account when the uniform
         interval starts and stops.
         """
-        t0e=t0-self.te
-        t1e=t1-self.te
-        if t1e<self.b[0]:
-            return 0
-        # Take the array of hazards at times and chop it off
-        # on the left at t0e.
-        b, w=(np.copy(self.b), np.copy(self.w))
-        left=np.where(b<=t0e)[0][-1]
-        b=b[left:]
-        w=w[left:]
-        b[0]=t0e
-        # Chop off the right after t1e.
-        right=np.where(b<t1e)[0][-1]
-        b=b[:(right+1)]
-        w=w[:(right+1)]
-        # Add a point back for the end point.
-        b=np.hstack([ b, np.array([t1e])])
-        w=np.hstack([ w, np.array([w[-1]])])
-
-        total=0.0
-        for idx in range(b.shape[0]-1):
-            total+=w[idx]*(b[idx+1]-b[idx])
-        return total
-
+        return self._integral(t1-self.te)-self._integral(t0-self.te)
 
     def implicit_hazard_integral(self, xa, t0):
-        t0e=t0-self.te
-        # Take the array of hazards at times and chop it off
-        # on the left at t0e.
-        b, w=(np.copy(self.b), np.copy(self.w))
-        left=np.where(b<=t0e)[0][-1]
-        b=b[left:]
-        w=w[left:]
-        b[0]=t0e
-        #logger.debug("Piecewise bleft {0} {1}".format(b, w))
-        b-=t0e   # Now it starts at 0.
-        #logger.debug("Piecewise bleft {0} {1}".format(b, w))
-
-        idx=0
-        t1e=0
-        while xa>0:
-            x0=b[idx]
-            if idx<b.shape[0]-1:
-                x1=b[idx+1]
-            else:
-                x1=float("inf")
-            if w[idx]>0:
-                t1e=x0+xa/w[idx]
-            else:
-                t1e=float("inf")
-            #logger.debug("Piecewise midcalc x0 {0} x1 {1} t1e {2}".format(
-            #    x0, x1, t1e))
-            if t1e<x1:
-                xa=0
-            else:
-                xa-=(x1-x0)*w[idx]
-            idx+=1
+        target=self._integral(t0-self.te)+xa
+        idx=np.searchsorted(self.cumulative, target, side="right")-1
+        if target<=self.cumulative[idx]:
+            return self.te+self.b[idx]
+        if self.w[idx]<=0:
+            return float("inf")
+        return self.te+self.b[idx]+(target-self.cumulative[idx])/self.w[idx]
+
+    def loglikelihood(self, t0, tf):
+        """
+        Log of the density of firing at tf, given no firing by t0.
+        """
+        return np.log(self.hazard(tf))-self.hazard_integral(t0, tf)
+
+    def enabling_time(self):
+        return self.te
+
+
+
+class HazardTable(object):
+    """
+    The integrated hazard of a distribution, as a function of time
+    since enabling, tabulated on a grid. The grid extends until the
+    survival falls below exp(-cutoff), and intervals are halved until
+    linear interpolation at each midpoint is within tolerance of the
+    integrated hazard. Interpolation is monotone because the
+    integrated hazard is nondecreasing, so it inverts directly.
+    The table is kept in lists because bisect on a list is faster
+    than NumPy for one value at a time.
+    """
+    def __init__(self, distribution, tolerance=1e-6, cutoff=40.0,
+            max_depth=40, max_doublings=128):
+        self.tolerance=tolerance
+        te=distribution.te
+        def integral(s):
+            # Past the end of a bounded support, some families
+            # return nan where the integrated hazard is infinite.
+            value=float(distribution.hazard_integral(te, te+s))
+            return float("inf") if np.isnan(value) else value
+
+        high=1.0
+        doubling_cnt=0
+        while not integral(high)>=cutoff:
+            if doubling_cnt==max_doublings:
+                raise RuntimeError(("The integrated hazard of {0} stays "+
+                    "below the cutoff {1} up to {2} after enabling, so "+
+                    "it may never fire and can't be tabulated").format(
+                    type(distribution).__name__, cutoff, high))
+            high*=2
+            doubling_cnt+=1
+        if np.isinf(integral(high)):
+            # The hazard is infinite before high, as for the uniform.
+            low=high/2
+            for i in range(100):
+                mid=0.5*(low+high)
+                value=integral(mid)
+                if np.isinf(value):
+                    high=mid
+                elif value<cutoff:
+                    low=mid
+                else:
+                    break
+            high=mid if np.isfinite(value) else low
+
+        coarse=[float(x) for x in np.linspace(0, high, 65)]
+        self.s=[coarse[0]]
+        self.integral=[integral(coarse[0])]
+        for right in coarse[1:]:
+            stack=[(self.s[-1], self.integral[-1], right, integral(right), 0)]
+            while stack:
+                a, fa, b, fb, depth=stack.pop()
+                mid=0.5*(a+b)
+                fmid=integral(mid)
+                if abs(fmid-0.5*(fa+fb))>tolerance and depth<max_depth:
+                    stack.append((mid, fmid, b, fb, depth+1))
+                    stack.append((a, fa, mid, fmid, depth+1))
+                else:
+                    self.s.append(b)
+                    self.integral.append(fb)
+        self.tail_hazard=((self.integral[-1]-self.integral[-2])/
+            (self.s[-1]-self.s[-2]))
+
+    def forward(self, s):
+        """
+        Integrated hazard from enabling to s after it.
+        """
+        if s<=0:
+            return 0.0
+        if s>=self.s[-1]:
+            return self.integral[-1]+self.tail_hazard*(s-self.s[-1])
+        idx=bisect.bisect_right(self.s, s)-1
+        return self.integral[idx]+self._slope(idx)*(s-self.s[idx])
+
+    def inverse(self, value):
+        if value>=self.integral[-1]:
+            return self.s[-1]+(value-self.integral[-1])/self.tail_hazard
+        idx=bisect.bisect_right(self.integral, value)-1
+        return self.s[idx]+(value-self.integral[idx])/self._slope(idx)
+
+    def hazard(self, s):
+        if s>=self.s[-1]:
+            return self.tail_hazard
+        return self._slope(max(bisect.bisect_right(self.s, s)-1, 0))
 
-        return t1e+t0
+    def _slope(self, idx):
+        return ((self.integral[idx+1]-self.integral[idx])/
+            (self.s[idx+1]-self.s[idx]))
+
+
+_hazard_tables=collections.OrderedDict()
+_hazard_table_limit=256
+
+
+def tabulated(distribution, tolerance=1e-6):
+    """
+    Returns a TabulatedDistribution that approximates the given one.
+    Tables are cached by family and parameters, so every transition
+    with the same parameters shares one table, whatever its
+    enabling time. The cache keeps the _hazard_table_limit most
+    recently used tables, so parameters that change continuously,
+    as in a fit, don't fill memory.
+    """
+    key=(type(distribution), distribution.parameters(), tolerance)
+    if key in _hazard_tables:
+        _hazard_tables.move_to_end(key)
+    else:
+        _hazard_tables[key]=HazardTable(distribution, tolerance)
+        if len(_hazard_tables)>_hazard_table_limit:
+            _hazard_tables.popitem(last=False)
+    return TabulatedDistribution(_hazard_tables[key], distribution.te, key)
+
+
+class TabulatedDistribution(Distribution):
+    """
+    Any distribution whose integrated hazard has been tabulated in a
+    HazardTable. Integrating and inverting the hazard are then
+    interpolations, no matter how expensive the original family.
+    Build these with tabulated().
+    """
+    def __init__(self, table, te, key=None):
+        self.table=table
+        self.te=te
+        self.key=key
+
+    def parameters(self):
+        if self.key is None:
+            return (id(self.table),)
+        return self.key
+
+    def sample(self, now, rng):
+        return self.implicit_hazard_integral(-math.log(rng.uniform(0, 1)), now)
+
+    def hazard(self, t):
+        if t<self.te:
+            return 0.0
+        return self.table.hazard(t-self.te)
+
+    def hazard_integral(self, t0, t1):
+        return self.table.forward(t1-self.te)-self.table.forward(t0-self.te)
+
+    def implicit_hazard_integral(self, xa, t0):
+        return self.te+self.table.inverse(self.table.forward(t0-self.te)+xa)
 
     def loglikelihood(self, t0, tf):
-        return None
- 
+        """
+        Log of the density of firing at tf, given no firing by t0.
+        """
+        return math.log(self.hazard(tf))-self.hazard_integral(t0, tf)
+
     def enabling_time(self):
         return self.te
 
@@ -518,9 +918,9 @@ class EmpiricalDistribution(object):
         acnt=len(self.samples)
         aidx=-1
         maxdiff=0.0
-        while aidx!=acnt:
+        while aidx+1!=acnt:
             v=self.samples[aidx+1]
-            while self.samples[aidx+1]==v:
+            while aidx+1!=acnt and self.samples[aidx+1]==v:
                 aidx+=1
             maxdiff=max(maxdiff,
                 abs(cdf(self.samples[aidx])-(aidx+1)/acnt))
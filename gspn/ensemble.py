@@ -0,0 +1,154 @@
+import logging
+import numpy as np
+
+logger=logging.getLogger(__file__)
+
+
+class CompiledNet:
+    """
+    An LLCP net translated into arrays, for nets where every place
+    holds an integer count and every transition follows mass action.
+    Each transition must provide
+
+     - stoichiometry(), a list of (place, change) pairs, and
+     - mass_action(), a rate constant c, so that its hazard is
+       c times the product of the counts of the places in depends().
+       A place listed twice in depends() enters squared.
+
+    Places are numbered in the order of LLCP.p. Column place_cnt of
+    any marking is a constant one, which pads the index arrays.
+    A LumpedTransition has no mass-action form, so compile a net
+    before calling LLCP.lump() on it.
+    """
+    def __init__(self, net):
+        self.net=net
+        self.place_cnt=len(net.p)
+        place_index=dict((id(p), idx) for (idx, p) in enumerate(net.p))
+        transition_cnt=len(net.t)
+        self.rate_constant=np.zeros(transition_cnt, dtype=np.double)
+        reactants=list()
+        changes=list()
+        for t in net.t:
+            self.rate_constant[t._id]=t.mass_action()
+            reactants.append([place_index[id(p)] for p in t.depends()])
+            changes.append([(place_index[id(p)], c)
+                for (p, c) in t.stoichiometry()])
+
+        order=max([len(r) for r in reactants]+[1])
+        self.reactant=np.full((transition_cnt, order), self.place_cnt,
+            dtype=np.int64)
+        for idx, r in enumerate(reactants):
+            self.reactant[idx, :len(r)]=r
+
+        width=max([len(c) for c in changes]+[1])
+        self.change_place=np.full((transition_cnt, width), self.place_cnt,
+            dtype=np.int64)
+        self.change=np.zeros((transition_cnt, width), dtype=np.int64)
+        for idx, c in enumerate(changes):
+            for col, (place_idx, amount) in enumerate(c):
+                self.change_place[idx, col]=place_idx
+                self.change[idx, col]=amount
+
+    def marking(self):
+        """
+        The current counts of the net's places, with the padding column.
+        """
+        counts=[p.count for p in self.net.p]
+        return np.array(counts+[1], dtype=np.int64)
+
+    def rates(self, marking):
+        """
+        Hazard rates of every transition for a stack of markings,
+        shaped (replicates, place_cnt+1), returned as
+        (replicates, transition_cnt).
+        """
+        product=np.prod(marking[:, self.reactant], axis=2)
+        return self.rate_constant[np.newaxis, :]*product
+
+
+class LockstepEnsemble:
+    """
+    Simulates many replicates of the same mass-action net at once.
+    Markings, rates and next firing times are held in arrays with one
+    row per replicate, and every step fires the next transition in all
+    replicates that have not finished, using Gibson and Bruck's
+    next reaction method, vectorized across replicates.
+    Because all distributions are exponential, a transition whose
+    rate changes from a to b rescales its remaining time by a/b.
+
+    Trajectories are returned as one list per replicate of
+    (transition, when), the same pairs RunnerFSM gives its observer.
+    """
+    def __init__(self, net, replicate_cnt, rng):
+        self.compiled=CompiledNet(net)
+        self.replicate_cnt=replicate_cnt
+        self.rng=rng
+
+    def init(self):
+        start=self.compiled.marking()
+        self.marking=np.tile(start, (self.replicate_cnt, 1))
+        self.now=np.zeros(self.replicate_cnt, dtype=np.double)
+        self.rate=self.compiled.rates(self.marking)
+        self.firing_time=self._sample(self.now[:, np.newaxis], self.rate)
+        self._fired=list()
+        self._when=list()
+
+    def run(self, end_time=float("inf")):
+        replicates=np.arange(self.replicate_cnt)
+        while True:
+            chosen=np.argmin(self.firing_time, axis=1)
+            when=self.firing_time[replicates, chosen]
+            active=np.isfinite(when) & (when<=end_time)
+            if not np.any(active):
+                break
+            rows=replicates[active]
+            chosen=chosen[active]
+            when=when[active]
+            self._fire(rows, chosen, when)
+            fired=np.full(self.replicate_cnt, -1, dtype=np.int64)
+            fired[rows]=chosen
+            self._fired.append(fired)
+            self._when.append(np.where(fired>=0, self.now, np.nan))
+        return self.trajectories()
+
+    def trajectories(self):
+        transitions=self.compiled.net.t
+        result=[list() for r in range(self.replicate_cnt)]
+        for fired, when in zip(self._fired, self._when):
+            for r in np.nonzero(fired>=0)[0]:
+                result[r].append((transitions[fired[r]], when[r]))
+        return result
+
+    def _fire(self, rows, chosen, when):
+        compiled=self.compiled
+        np.add.at(self.marking,
+            (rows[:, np.newaxis], compiled.change_place[chosen]),
+            compiled.change[chosen])
+        self.now[rows]=when
+
+        old_rate=self.rate[rows]
+        new_rate=compiled.rates(self.marking[rows])
+        remaining=self.firing_time[rows]-when[:, np.newaxis]
+        resample=(old_rate<=0)
+        resample[np.arange(rows.shape[0]), chosen]=True
+        keep=(~resample) & (new_rate>0)
+        times=np.full(new_rate.shape, np.inf)
+        with np.errstate(invalid="ignore"):
+            times[keep]=(when[:, np.newaxis]+
+                remaining*old_rate/np.where(new_rate>0, new_rate, 1))[keep]
+        fresh=resample & (new_rate>0)
+        times[fresh]=self._sample(
+            np.broadcast_to(when[:, np.newaxis], new_rate.shape)[fresh],
+            new_rate[fresh])
+        self.firing_time[rows]=times
+        self.rate[rows]=new_rate
+
+    def _sample(self, now, rate):
+        """
+        Absolute firing times for exponential rates, infinite where
+        the rate is zero.
+        """
+        rate=np.asarray(rate, dtype=np.double)
+        interval=self.rng.exponential(size=rate.shape)
+        with np.errstate(divide="ignore"):
+            return np.where(rate>0, now+interval/rate, np.inf)
@@ -0,0 +1,94 @@
+import logging
+import numpy as np
+
+logger=logging.getLogger(__file__)
+
+
+class FenwickTree(object):
+    """
+    A Fenwick, or binary indexed, tree over an array of non-negative
+    weights. Setting one weight, summing all of them, and finding
+    which weight a cumulative value falls in are each O(log n).
+    """
+    def __init__(self, cnt):
+        self.values=np.zeros(cnt, dtype=np.double)
+        self._tree=np.zeros(cnt+1, dtype=np.double)
+        self._top=1
+        while 2*self._top<=cnt:
+            self._top*=2
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    def grow(self, cnt):
+        """
+        Makes room for at least cnt weights, with new weights zero.
+        """
+        old=self.values.shape[0]
+        if cnt<=old:
+            return
+        self.values=np.hstack([self.values, np.zeros(cnt-old)])
+        self._tree=np.zeros(cnt+1, dtype=np.double)
+        while 2*self._top<=cnt:
+            self._top*=2
+        self.rebuild()
+
+    def set(self, idx, value):
+        delta=value-self.values[idx]
+        if delta==0:
+            return
+        self.values[idx]=value
+        tree=self._tree
+        cnt=self.values.shape[0]
+        idx+=1
+        while idx<=cnt:
+            tree[idx]+=delta
+            idx+=idx & (-idx)
+
+    def prefix(self, idx):
+        """
+        The sum of the first idx weights.
+        """
+        tree=self._tree
+        total=0.0
+        while idx>0:
+            total+=tree[idx]
+            idx-=idx & (-idx)
+        return total
+
+    def total(self):
+        return self.prefix(self.values.shape[0])
+
+    def find(self, u):
+        """
+        Returns the index i for which prefix(i)<=u<prefix(i+1),
+        so that each index is chosen with probability proportional
+        to its weight when u is uniform on [0, total()).
+        """
+        tree=self._tree
+        cnt=self.values.shape[0]
+        pos=0
+        step=self._top
+        while step>0:
+            if pos+step<=cnt and tree[pos+step]<=u:
+                pos+=step
+                u-=tree[pos]
+            step//=2
+        return min(pos, cnt-1)
+
+    def rebuild(self):
+        """
+        Recompute partial sums from the weights to discard roundoff
+        accumulated by many calls to set().
+        """
+        tree=self._tree
+        cnt=self.values.shape[0]
+        tree[0]=0
+        tree[1:]=self.values
+        # Each node adds into its parent once its own children are in,
+        # so add one level, by lowest set bit, at a time.
+        step=1
+        while step<cnt:
+            idx=np.arange(step, cnt+1-step, 2*step)
+            tree[idx+step]+=tree[idx]
+            step*=2
@@ -0,0 +1,148 @@
+import logging
+import numpy as np
+
+logger=logging.getLogger(__file__)
+
+
+class IndexedHeap(object):
+    """
+    A d-ary min-heap of floating point keys, each attached to a
+    non-negative integer item, such as the id LLCP assigns to a
+    transition. Keys and items live in preallocated NumPy arrays,
+    and a third array maps each item to its position in the heap,
+    so that an item's key can be changed in either direction,
+    or the item removed, in O(log n) without searching.
+    The arrays double in size when they fill.
+    """
+    def __init__(self, capacity=1024, arity=4):
+        assert(arity>1)
+        self.arity=arity
+        self._len=0
+        self._key=np.zeros(capacity, dtype=np.double)
+        self._item=np.zeros(capacity, dtype=np.int64)
+        self._position=np.full(capacity, -1, dtype=np.int64)
+
+    def clear(self):
+        self._position[self._item[:self._len]]=-1
+        self._len=0
+
+    def copy(self):
+        other=IndexedHeap.__new__(IndexedHeap)
+        other.arity=self.arity
+        other._len=self._len
+        other._key=self._key.copy()
+        other._item=self._item.copy()
+        other._position=self._position.copy()
+        return other
+
+    def empty(self):
+        return self._len==0
+
+    def __len__(self):
+        return self._len
+
+    def __contains__(self, item):
+        return item<self._position.shape[0] and self._position[item]>=0
+
+    def peek(self):
+        """
+        Returns (key, item) for the least key.
+        """
+        if self._len==0:
+            raise IndexError("peek from an empty IndexedHeap")
+        return (float(self._key[0]), int(self._item[0]))
+
+    def key(self, item):
+        return float(self._key[self._position[item]])
+
+    def insert(self, item, key):
+        if item>=self._position.shape[0]:
+            self._grow_items(item+1)
+        if self._len==self._key.shape[0]:
+            self._grow_heap()
+        idx=self._len
+        self._len+=1
+        self._sift_up(idx, item, key)
+
+    def update(self, item, key):
+        """
+        Change the key of an item already in the heap. The new key
+        may be larger or smaller than the old one.
+        """
+        idx=self._position[item]
+        if key<self._key[idx]:
+            self._sift_up(idx, item, key)
+        else:
+            self._sift_down(idx, item, key)
+
+    def delete(self, item):
+        idx=self._position[item]
+        self._position[item]=-1
+        self._len-=1
+        if idx==self._len:
+            return
+        # Move the last entry into the hole and restore order.
+        last_key=self._key[self._len]
+        last_item=self._item[self._len]
+        if idx>0 and last_key<self._key[(idx-1)//self.arity]:
+            self._sift_up(idx, last_item, last_key)
+        else:
+            self._sift_down(idx, last_item, last_key)
+
+    def extract(self):
+        """
+        Removes the least key and returns (key, item).
+        """
+        top=self.peek()
+        self.delete(top[1])
+        return top
+
+    def _sift_up(self, idx, item, key):
+        keys=self._key
+        items=self._item
+        position=self._position
+        while idx>0:
+            parent=(idx-1)//self.arity
+            if keys[parent]<=key:
+                break
+            keys[idx]=keys[parent]
+            items[idx]=items[parent]
+            position[items[idx]]=idx
+            idx=parent
+        keys[idx]=key
+        items[idx]=item
+        position[item]=idx
+
+    def _sift_down(self, idx, item, key):
+        keys=self._key
+        items=self._item
+        position=self._position
+        arity=self.arity
+        length=self._len
+        while True:
+            first=arity*idx+1
+            if first>=length:
+                break
+            last=min(first+arity, length)
+            child=first+int(np.argmin(keys[first:last]))
+            if keys[child]>=key:
+                break
+            keys[idx]=keys[child]
+            items[idx]=items[child]
+            position[items[idx]]=idx
+            idx=child
+        keys[idx]=key
+        items[idx]=item
+        position[item]=idx
+
+    def _grow_heap(self):
+        capacity=2*self._key.shape[0]
+        self._key=np.resize(self._key, capacity)
+        self._item=np.resize(self._item, capacity)
+
+    def _grow_items(self, minimum):
+        old=self._position.shape[0]
+        capacity=max(2*old, minimum)
+        position=np.full(capacity, -1, dtype=np.int64)
+        position[:old]=self._position
+        self._position=position
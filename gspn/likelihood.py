@@ -0,0 +1,196 @@
+import logging
+import math
+import concurrent.futures
+import numpy as np
+from gspn.batch import MixedBatch
+
+logger=logging.getLogger(__file__)
+
+
+class LikelihoodEngine(object):
+    """
+    The log-likelihood of an observed trajectory, a list of
+    (transition, when) such as RunnerFSM gives its observer.
+    The engine replays the trajectory through the net. Every time
+    LLCP reports that a transition's distribution changed, the engine
+    charges the integrated hazard of the old distribution since the
+    transition's last change, so each event costs time proportional
+    to the number of transitions it affects, not the number enabled.
+    Each firing adds the log of the hazard of the transition that fired.
+
+    The marking when the engine is made is taken as the start of
+    every trajectory, so log_likelihood can be called repeatedly.
+    Transitions that choose among outcomes when they fire get the rng.
+    A replay is only faithful if those choices match the observation.
+    Members of transition families are rebuilt on each replay,
+    so observed members are matched by family and key.
+    """
+    def __init__(self, system, rng=None):
+        self.system=system
+        self.rng=rng
+        self._start=system.snapshot()
+
+    def log_likelihood(self, events, end_time=None):
+        """
+        If end_time is given, the trajectory was observed until then,
+        so transitions still enabled also survived to end_time.
+        The result is -inf if an observed transition wasn't enabled.
+        """
+        self._since=np.zeros(len(self.system.t), dtype=np.double)
+        self.total=0.0
+        self.system.restore(self._start)
+        self.system.init(self._observe)
+        for observed, when in events:
+            transition=self.system.current(observed, self._observe)
+            distribution=(transition._distribution
+                if transition is not None else None)
+            if distribution is None:
+                logger.debug("{0} fired at {1} but is not enabled".format(
+                    observed, when))
+                return -float("inf")
+            if not self._fired(transition, distribution, when):
+                return -float("inf")
+            self.system.fire(transition, when, self.rng, self._observe)
+        if end_time is not None:
+            self.system.enabled_transitions(
+                lambda t, dist, now: self._charge(t, dist, end_time))
+        return self.total
+
+    def _observe(self, transition, olddist, newdist, firing, now):
+        if transition._id>=self._since.shape[0]:
+            # Members of transition families arrive after init.
+            self._since=np.hstack([self._since,
+                np.zeros(transition._id+1, dtype=np.double)])
+        if olddist is not None:
+            self._charge(transition, olddist, now)
+        self._since[transition._id]=now
+
+    def _charge(self, transition, distribution, now):
+        self.total-=distribution.hazard_integral(
+            self._since[transition._id], now)
+
+    def _fired(self, transition, distribution, when):
+        hazard=distribution.hazard(when)
+        if hazard<=0:
+            return False
+        self.total+=math.log(hazard)
+        return True
+
+
+class TrajectoryRecord(object):
+    """
+    The pieces of a trajectory's log-likelihood, recorded once by
+    record_trajectory(), so that it can be evaluated for many parameter
+    sets with NumPy. For each distribution family, segments holds
+    the intervals over which each transition kept one distribution
+    and firings holds the distributions that fired, each as a dictionary
+    of arrays: transition ids, te, the interval t0 and t1 or the firing
+    time when, and parameter, the distribution's parameters when
+    recorded, one row per name in the family's batch class.
+    Families are keyed by their batch class from gspn.batch.
+
+    The record holds only arrays, so it is cheap to send to
+    other processes.
+    """
+    def __init__(self, segments, firings):
+        self.segments=segments
+        self.firings=firings
+
+    def log_likelihood(self, theta, parameterize, workers=None):
+        """
+        theta is a matrix with one parameter set per row.
+        parameterize(batch_class, transition, parameter, theta) returns
+        the family's parameters, one array per name in the batch class's
+        parameter_names, each broadcastable to (sets, entries), where
+        transition and parameter are the recorded ids and parameters.
+        It must be picklable if workers is given, in which case rows
+        of theta are divided among that many processes.
+        Returns the log-likelihood of each row.
+        """
+        theta=np.atleast_2d(theta)
+        if workers is None:
+            return self._evaluate(theta, parameterize)
+        chunks=np.array_split(theta, workers)
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            futures=[executor.submit(self._evaluate, chunk, parameterize)
+                for chunk in chunks]
+            return np.concatenate([f.result() for f in futures])
+
+    def _evaluate(self, theta, parameterize):
+        total=np.zeros(theta.shape[0], dtype=np.double)
+        for batch_class, segment in self.segments.items():
+            parameters=parameterize(batch_class, segment["transition"],
+                segment["parameter"], theta)
+            integral=batch_class.integrate(*parameters,
+                segment["te"], segment["t0"], segment["t1"])
+            shape=(theta.shape[0], segment["te"].shape[0])
+            total-=np.sum(np.broadcast_to(integral, shape), axis=1)
+        for batch_class, firing in self.firings.items():
+            parameters=parameterize(batch_class, firing["transition"],
+                firing["parameter"], theta)
+            log_hazard=batch_class.log_hazard(*parameters,
+                firing["te"], firing["when"])
+            shape=(theta.shape[0], firing["te"].shape[0])
+            total+=np.sum(np.broadcast_to(log_hazard, shape), axis=1)
+        return total
+
+
+class _Recorder(LikelihoodEngine):
+    def log_likelihood(self, events, end_time=None):
+        self._segments=dict()
+        self._firings=dict()
+        return LikelihoodEngine.log_likelihood(self, events, end_time)
+
+    def _charge(self, transition, distribution, now):
+        self._append(self._segments, distribution, transition,
+            t0=self._since[transition._id], t1=now)
+        LikelihoodEngine._charge(self, transition, distribution, now)
+
+    def _fired(self, transition, distribution, when):
+        self._append(self._firings, distribution, transition, when=when)
+        return LikelihoodEngine._fired(self, transition, distribution, when)
+
+    def _append(self, table, distribution, transition, **times):
+        batch_class=MixedBatch.batch_classes.get(type(distribution), None)
+        if batch_class is None:
+            raise RuntimeError(("There is no batch kernel for the "+
+                "{0} of transition {1}").format(type(distribution).__name__,
+                transition))
+        entry=table.setdefault(batch_class, dict(transition=list(), te=list(),
+            parameter=list()))
+        entry["transition"].append(transition._id)
+        entry["te"].append(distribution.te)
+        entry["parameter"].append([getattr(distribution, name)
+            for name in batch_class.parameter_names])
+        for name, value in times.items():
+            entry.setdefault(name, list()).append(value)
+
+    def record(self):
+        tables=list()
+        for table in [self._segments, self._firings]:
+            arrays=dict()
+            for batch_class, entry in table.items():
+                columns=dict((name, np.array(values, dtype=np.double))
+                    for (name, values) in entry.items())
+                columns["transition"]=np.array(entry["transition"],
+                    dtype=np.int64)
+                columns["parameter"]=np.array(entry["parameter"],
+                    dtype=np.double).reshape(-1,
+                    len(batch_class.parameter_names)).T
+                arrays[batch_class]=columns
+            tables.append(arrays)
+        return TrajectoryRecord(*tables)
+
+
+def record_trajectory(system, events, end_time=None, rng=None):
+    """
+    Replays events, a list of (transition, when), from the current
+    marking of the system, as LikelihoodEngine does, and returns a
+    TrajectoryRecord. Every distribution must be a family in
+    gspn.batch.MixedBatch. Which transitions are enabled when
+    is taken to be the same for every parameter set.
+    """
+    recorder=_Recorder(system, rng)
+    if recorder.log_likelihood(events, end_time)==-float("inf"):
+        raise RuntimeError("The trajectory is impossible for this net.")
+    return recorder.record()
@@ -1,4 +1,8 @@
+import copy
 import logging
+import numpy as np
+from gspn.distributions import ExponentialDistribution
+from gspn.lump import LumpedTransition, exchangeable_key
 
 logger=logging.getLogger(__file__)
 
@@ -21,52 +25,329 @@ class LLCPTransition(object):
         """
         return set()
 
+class TransitionFamily(object):
+    """
+    Describes many transitions at once, such as infection of j by i
+    for every pair of individuals, without creating them.
+    Each member has a hashable key. LLCP builds a member, with
+    instance(key), only to see whether it is enabled, and keeps it
+    only while it is enabled, so memory scales with the number
+    of enabled members, not possible ones.
+    """
+    def candidates(self, place):
+        """
+        Keys of members that may become enabled when this place
+        changes. It may include members that stay disabled, but
+        must include every one that becomes enabled. Members that
+        are already enabled are found by LLCP, so they needn't be
+        included. At init, LLCP asks about every place.
+        """
+        return list()
+    def instance(self, key):
+        """
+        A new transition for this key.
+        """
+        raise NotImplementedError()
+
 class LLCP:
     """
     Long-lived competing processes.
     """
     def __init__(self):
         self._current_time=0.0
+        self.p=list()
         self.t=list()
+        self._frozen=False
+        self._enabled=list()
+        self._enabled_position=np.zeros(0, dtype=np.int64)
+        self.elided_updates=0
+        self._concrete_cnt=0
+        self._families=list()
+        self._free=list()
+        self._instance_dependents=dict()
+        self._lumped=dict()
 
     def add_place(self, place):
+        if self._frozen:
+            raise RuntimeError("Cannot add a place to a frozen LLCP.")
         place._adjacency=list() # inject
+        place._id=len(self.p) # inject
+        self.p.append(place)
 
     def add_transition(self, transition):
         """
         A transition must have two dictionary members,
         place and dep, which are places used in firing
         and dependencies for determining hazard rates.
+        Each transition is given an integer id, its index in self.t.
         """
+        self._check_add_transition()
         transition._distribution=None # inject
+        transition._id=len(self.t) # inject
         self.t.append(transition)
+        self._concrete_cnt=len(self.t)
         for d in transition.depends():
             d._adjacency.append(transition)
 
+    def add_places(self, places):
+        """
+        Adds a list of places at once.
+        """
+        if self._frozen:
+            raise RuntimeError("Cannot add a place to a frozen LLCP.")
+        start=len(self.p)
+        for offset, place in enumerate(places):
+            place._adjacency=list() # inject
+            place._id=start+offset # inject
+        self.p.extend(places)
+
+    def add_transitions(self, transitions):
+        """
+        Adds a list of transitions at once, which is faster than
+        add_transition for the millions of transitions of
+        a large spatial model.
+        """
+        self._check_add_transition()
+        start=len(self.t)
+        for offset, transition in enumerate(transitions):
+            transition._distribution=None # inject
+            transition._id=start+offset # inject
+            for d in transition.depends():
+                d._adjacency.append(transition)
+        self.t.extend(transitions)
+        self._concrete_cnt=len(self.t)
+
+    def _check_add_transition(self):
+        if self._frozen:
+            raise RuntimeError("Cannot add a transition to a frozen LLCP.")
+        if len(self.t)!=self._concrete_cnt:
+            raise RuntimeError(("Cannot add a transition while members "+
+                "of transition families are enabled."))
+
+    def add_family(self, family):
+        """
+        Adds a TransitionFamily. Its members are given ids after those
+        of the transitions, and an id is reused once its member is
+        disabled, so samplers see the members as ordinary transitions
+        that come and go. While a member isn't enabled, its slot in
+        self.t is None. Families may be added to a frozen LLCP.
+        """
+        family._instances=dict() # inject
+        self._families.append(family)
+
+    def lump(self, key=exchangeable_key):
+        """
+        Replaces each group of two or more transitions with the
+        same key(transition) by one LumpedTransition, so that a sampler
+        tracks one entry for the group. With the default key, those are
+        transitions of the same class affecting the same places.
+        Every member must have an exponential distribution when enabled,
+        and members enabled in the current marking are checked here,
+        raising a RuntimeError. Transitions are renumbered, so lump
+        before freeze() or init().
+
+        A lumped net runs with any sampler that accepts exponential
+        distributions, and with TauLeaping when members of a group
+        share their stoichiometry(), but not with CompiledNet, because
+        a group's hazard isn't a single mass-action term.
+        Returns the number of transitions afterwards.
+        """
+        self._check_add_transition()
+        groups=dict()
+        for t in self.t:
+            groups.setdefault(key(t), list()).append(t)
+        transitions=list()
+        for members in groups.values():
+            if len(members)>1:
+                for member in members:
+                    enabled, dist=member.enabled(self._current_time)
+                    if enabled and not isinstance(dist,
+                            ExponentialDistribution):
+                        raise RuntimeError(("Can't lump {0} because "+
+                            "it has a {1}, not an "+
+                            "ExponentialDistribution").format(member,
+                            type(dist).__name__))
+                transitions.append(LumpedTransition(members))
+            else:
+                transitions.append(members[0])
+        for p in self.p:
+            p._adjacency=list()
+        self.t=list()
+        self._concrete_cnt=0
+        self._lumped=dict()
+        self.add_transitions(transitions)
+        for t in transitions:
+            if isinstance(t, LumpedTransition):
+                for member_idx, member in enumerate(t.members):
+                    for place in member.depends():
+                        self._lumped.setdefault(place._id, list()).append(
+                            (t, member_idx))
+        logger.debug("lumped into {0} transitions".format(len(self.t)))
+        return len(self.t)
+
+    def freeze(self):
+        """
+        Compile the graph of places and transitions into integer arrays
+        in compressed sparse row form. place_transition lists,
+        for each place, the ids of transitions that depend on it, and
+        transition_place lists, for each transition, the places
+        it affects when it fires. An array of generation stamps, one
+        per transition, removes duplicates among affected transitions
+        without building a set. This assumes each transition's
+        affected() doesn't change. No places or transitions can be
+        added afterwards.
+        """
+        if self._frozen:
+            return
+        self._place_offset, self._place_transition=self._compress(
+            [[t._id for t in p._adjacency] for p in self.p])
+        self._transition_offset, self._transition_place=self._compress(
+            [[p._id for p in t.affected()] for t in self.t])
+        self._stamp=np.zeros(len(self.t), dtype=np.int64)
+        self._generation=0
+        for p in self.p:
+            del p._adjacency
+        self._frozen=True
+
+    def _compress(self, rows):
+        offset=np.zeros(len(rows)+1, dtype=np.int64)
+        offset[1:]=np.cumsum([len(r) for r in rows])
+        entries=np.fromiter((x for r in rows for x in r), dtype=np.int64,
+            count=offset[-1])
+        return offset, entries
+
     def init(self, report=None):
         self._current_time=0.0
+        del self.t[self._concrete_cnt:]
+        self._free=list()
+        self._instance_dependents=dict()
+        for family in self._families:
+            family._instances=dict()
+        self._enabled=list()
+        self._enabled_position=np.full(len(self.t), -1, dtype=np.int64)
+        self.elided_updates=0
         for transition in self.t:
             transition._distribution=None
-            if "_nr" in dir(transition):
-                del transition._nr
+            if isinstance(transition, LumpedTransition):
+                transition.reset()
         self._initial_enable(report)
 
     def current_time(self):
         return self._current_time
 
+    def current(self, transition, report=None):
+        """
+        The transition that stands for the given one in the current
+        state. init() and restore() rebuild members of families, so
+        a member recorded earlier, as in an observed trajectory,
+        is found by its family and key, and built if it is enabled.
+        Returns None for a member that isn't enabled.
+        """
+        family=getattr(transition, "_family", None)
+        if family is None:
+            return transition
+        key=transition._key
+        if key not in family._instances:
+            self._materialize(family, key, report)
+        return family._instances.get(key, None)
+
+    def snapshot(self):
+        """
+        Records the current time, the marking and the distribution
+        of every transition, so that restore() can return to this state
+        any number of times. Each place's members, other than those
+        LLCP injects, are copied with copy.copy, so a place may modify
+        a list or set it holds, but not the contents of one. Distributions
+        are never modified, so they are shared, as are the places,
+        the transitions and the graph between them.
+        """
+        injected=("_adjacency", "_id")
+        places=[dict((k, copy.copy(v)) for (k, v) in p.__dict__.items()
+            if k not in injected) for p in self.p]
+        return {
+            "time" : self._current_time,
+            "places" : places,
+            "transitions" : list(self.t),
+            "distributions" : [t._distribution if t is not None else None
+                for t in self.t],
+            "free" : list(self._free),
+            "instances" : [dict(f._instances) for f in self._families],
+            "instance_dependents" : dict((pid, dict(d)) for (pid, d)
+                in self._instance_dependents.items()),
+            "enabled" : list(self._enabled),
+            "enabled_position" : self._enabled_position.copy(),
+            "elided_updates" : self.elided_updates
+        }
+
+    def restore(self, snapshot):
+        """
+        Returns to the state recorded by snapshot(). Samplers keep
+        their own state, so use the sampler's restore, which calls this.
+        """
+        self._current_time=snapshot["time"]
+        for p, members in zip(self.p, snapshot["places"]):
+            p.__dict__.update((k, copy.copy(v)) for (k, v) in members.items())
+        self.t[:]=snapshot["transitions"]
+        for t, dist in zip(self.t, snapshot["distributions"]):
+            if t is not None:
+                t._distribution=dist
+                if isinstance(t, LumpedTransition):
+                    # Member rates belong to the abandoned branch,
+                    # so ask every member again in the restored marking.
+                    t.reset()
+                    t.enabled(self._current_time)
+        self._free=list(snapshot["free"])
+        for family, instances in zip(self._families, snapshot["instances"]):
+            family._instances=dict(instances)
+        self._instance_dependents=dict((pid, dict(d)) for (pid, d)
+            in snapshot["instance_dependents"].items())
+        self._enabled=list(snapshot["enabled"])
+        self._enabled_position=snapshot["enabled_position"].copy()
+        self.elided_updates=snapshot["elided_updates"]
+
     def fire(self, transition, when, rng, report=None):
+        """
+        A transition's fire() may return the list of places it changed,
+        which can be empty, as for a candidate event rejected by
+        thinning. Then only transitions depending on those places,
+        and the fired transition itself, are re-evaluated, instead of
+        those depending on every place in affected().
+        """
         self._current_time=when
-        transition.fire(when, rng)
+        changed=transition.fire(when, rng)
         if report is not None:
             report(transition, transition._distribution, None, True,
                 self._current_time)
-        transition._distribution=None
-        self._incremental_update(transition, report)
+        self._set_distribution(transition, None)
+        if changed is None:
+            self._incremental_update(transition, report)
+        else:
+            self._update_places(changed, report)
+        if transition._distribution is not None:
+            return
+        if "_family" in transition.__dict__:
+            # Unless the update already released it, see whether
+            # the member is enabled again.
+            family=transition._family
+            if family._instances.get(transition._key, None) is transition:
+                self._reevaluate(transition, report)
+                if transition._distribution is None:
+                    self._release(transition)
+        elif changed is not None:
+            self._reevaluate(transition, report)
+
+    def advance(self, places, when, report=None):
+        """
+        Another engine, such as tau-leaping, changed the marking of
+        these places, with time moving forward to when. Re-evaluate
+        every transition that depends on them.
+        """
+        self._current_time=when
+        self._update_places(places, report)
 
     def enabled_transitions(self, functor):
-        for t in self.t:
-            if t._distribution is not None:
-                functor(t, t._distribution, self._current_time)
+        for t in self._enabled:
+            functor(t, t._distribution, self._current_time)
 
     def _initial_enable(self, report):
         for t in self.t:
@@ -74,18 +355,158 @@ class LLCP:
             if enabled:
                 if report is not None:
                     report(t, None, dist, False, self._current_time)
-                t._distribution=dist
+                self._set_distribution(t, dist)
             else:
-                t._distribution=None
+                self._set_distribution(t, None)
+        if self._families:
+            self._update_families(self.p, report)
 
     def _incremental_update(self, fired_transition, report):
-        affected_transitions=set()
-        for p in fired_transition.affected():
-            affected_transitions.update(p._adjacency)
-        for t in affected_transitions:
-            was_enabled=t._distribution is not None
-            enabled, dist=t.enabled(self._current_time)
-            if report is not None and (was_enabled or enabled):
-                report(t, t._distribution, dist, False, self._current_time)
-            t._distribution=dist
+        tid=fired_transition._id
+        if self._frozen and tid<self._concrete_cnt:
+            place_ids=self._transition_place[
+                self._transition_offset[tid]:self._transition_offset[tid+1]]
+            self._update_place_ids(place_ids, report)
+            if self._families:
+                self._update_families([self.p[pid] for pid in place_ids],
+                    report)
+        else:
+            self._update_places(fired_transition.affected(), report)
+
+    def _update_places(self, places, report):
+        if self._frozen:
+            self._update_place_ids([p._id for p in places], report)
+        else:
+            if self._lumped:
+                self._touch([p._id for p in places])
+            # A dictionary, not a set, so that transitions are reported
+            # in the same order in every process, for reproducibility.
+            affected_transitions=dict()
+            for p in places:
+                for t in p._adjacency:
+                    affected_transitions[t._id]=t
+            for t in affected_transitions.values():
+                self._reevaluate(t, report)
+        if self._families:
+            self._update_families(places, report)
+
+    def _update_families(self, places, report):
+        """
+        Re-evaluates enabled members that depend on these places,
+        releasing those that become disabled, then builds candidates
+        from each family and keeps those that are enabled.
+        """
+        members=dict()
+        for p in places:
+            for t in self._instance_dependents.get(p._id, dict()).values():
+                members[t._id]=t
+        for t in members.values():
+            self._reevaluate(t, report)
+            if t._distribution is None:
+                self._release(t)
+        for family in self._families:
+            keys=dict()
+            for p in places:
+                for key in family.candidates(p):
+                    keys[key]=None
+            instances=family._instances
+            for key in keys:
+                if key not in instances:
+                    self._materialize(family, key, report)
+
+    def _materialize(self, family, key, report):
+        t=family.instance(key)
+        enabled, dist=t.enabled(self._current_time)
+        if not enabled:
+            return
+        if self._free:
+            tid=self._free.pop()
+            self.t[tid]=t
+        else:
+            tid=len(self.t)
+            self.t.append(t)
+            if tid>=self._enabled_position.shape[0]:
+                extra=max(tid+1, 2*self._enabled_position.shape[0])
+                self._enabled_position=np.hstack([self._enabled_position,
+                    np.full(extra-self._enabled_position.shape[0], -1,
+                    dtype=np.int64)])
+        t._distribution=None # inject
+        t._id=tid # inject
+        t._family=family # inject
+        t._key=key # inject
+        family._instances[key]=t
+        for d in t.depends():
+            self._instance_dependents.setdefault(d._id, dict())[tid]=t
+        if report is not None:
+            report(t, None, dist, False, self._current_time)
+        self._set_distribution(t, dist)
+
+    def _release(self, t):
+        """
+        Forgets a disabled member of a family and frees its id.
+        """
+        del t._family._instances[t._key]
+        for d in t.depends():
+            del self._instance_dependents[d._id][t._id]
+        self.t[t._id]=None
+        self._free.append(t._id)
+
+    def _touch(self, place_ids):
+        """
+        Marks the members of lumped transitions that depend on
+        these places, so the lumped transition asks them again.
+        """
+        for pid in place_ids:
+            for lumped, member_idx in self._lumped.get(pid, ()):
+                lumped.touch(member_idx)
+
+    def _update_place_ids(self, place_ids, report):
+        if self._lumped:
+            self._touch(place_ids)
+        self._generation+=1
+        generation=self._generation
+        stamp=self._stamp
+        offset=self._place_offset
+        dependents=self._place_transition
+        for pid in place_ids:
+            for tid in dependents[offset[pid]:offset[pid+1]]:
+                if stamp[tid]!=generation:
+                    stamp[tid]=generation
+                    self._reevaluate(self.t[tid], report)
+
+    def _reevaluate(self, t, report):
+        """
+        If the transition's distribution is unchanged, nobody is told.
+        elided_updates counts how often that happens.
+        """
+        was_enabled=t._distribution is not None
+        enabled, dist=t.enabled(self._current_time)
+        if was_enabled and dist is not None and dist==t._distribution:
+            self.elided_updates+=1
+            return
+        if report is not None and (was_enabled or enabled):
+            report(t, t._distribution, dist, False, self._current_time)
+        self._set_distribution(t, dist)
+
+    def _set_distribution(self, t, dist):
+        """
+        Keeps _enabled, a dense list of enabled transitions, in step
+        with each transition's distribution. _enabled_position holds
+        each transition's index in that list, or -1, so removal
+        swaps the last entry into the hole.
+        """
+        position=self._enabled_position
+        tid=t._id
+        if dist is not None:
+            if position[tid]<0:
+                position[tid]=len(self._enabled)
+                self._enabled.append(t)
+        elif position[tid]>=0:
+            idx=position[tid]
+            last=self._enabled.pop()
+            if last is not t:
+                self._enabled[idx]=last
+                position[last._id]=idx
+            position[tid]=-1
+        t._distribution=dist
 
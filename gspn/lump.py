@@ -0,0 +1,167 @@
+import logging
+from gspn.distributions import ExponentialDistribution
+from gspn.fenwick import FenwickTree
+
+logger=logging.getLogger(__file__)
+
+
+class LumpedTransition(object):
+    """
+    Stands in for a group of transitions with exponential
+    distributions that change the marking in the same way, such as
+    infection of one individual by any of the others. Its hazard is
+    the sum of the hazards of the enabled members, so with equal rates
+    it is the rate times their number, and when it fires, it chooses
+    a member in proportion to its rate and fires that one.
+    The member that fired is kept in last_fired for observers.
+
+    LLCP marks members dirty when places they depend on change,
+    so enabled() only asks those members again. The total is kept
+    up to date by differences, and re-summed after as many changes as
+    there are members, while a Fenwick tree over member rates chooses
+    the member to fire, so neither a change nor a firing costs time
+    in proportion to the size of the group.
+    Build these with LLCP.lump().
+    """
+    def __init__(self, members):
+        self.members=members
+        self.rate=[0.0]*len(members)
+        self.total=0.0
+        self.last_fired=None
+        self._tree=FenwickTree(len(members))
+        self._depends=self._union([m.depends() for m in members])
+        self._affected=self._union([m.affected() for m in members])
+        self.reset()
+
+    def _union(self, place_lists):
+        places=dict()
+        for place_list in place_lists:
+            for place in place_list:
+                places[id(place)]=place
+        return list(places.values())
+
+    def reset(self):
+        """
+        Forget every member's rate, as after init or restore.
+        """
+        self._dirty=list(range(len(self.members)))
+        self._current=None
+
+    def touch(self, member_idx):
+        # A member touched twice is asked twice, which costs
+        # less than keeping the dirty members unique.
+        self._dirty.append(member_idx)
+
+    def depends(self):
+        return self._depends
+
+    def affected(self):
+        return self._affected
+
+    def stoichiometry(self):
+        """
+        The members' stoichiometry, for TauLeaping, when every member
+        changes the same places by the same amounts.
+        """
+        first=self.members[0].stoichiometry()
+        expected=sorted((id(place), change) for (place, change) in first)
+        for member in self.members[1:]:
+            found=sorted((id(place), change)
+                for (place, change) in member.stoichiometry())
+            if found!=expected:
+                raise RuntimeError(("Members {0} and {1} of a "+
+                    "LumpedTransition have different stoichiometry").format(
+                    self.members[0], member))
+        return first
+
+    def mass_action(self):
+        """
+        The hazard of a group is a sum over members of products of
+        counts, which CompiledNet can't express as one rate constant
+        times one product, so compile the net before lumping it.
+        """
+        raise RuntimeError(("A LumpedTransition of {0} members has no "+
+            "mass-action rate constant. Build CompiledNet and "+
+            "LockstepEnsemble from the net before it is lumped.").format(
+            len(self.members)))
+
+    def _member_rate(self, idx, now):
+        enabled, dist=self.members[idx].enabled(now)
+        if not enabled:
+            return 0.0
+        elif isinstance(dist, ExponentialDistribution):
+            return dist.lam
+        raise RuntimeError(("A LumpedTransition requires an "+
+            "ExponentialDistribution but member {0} "+
+            "has a {1}").format(self.members[idx], type(dist).__name__))
+
+    def enabled(self, now):
+        dirty=self._dirty
+        if dirty:
+            self._dirty=list()
+            rate=self.rate
+            if len(dirty)>=len(rate):
+                for idx in range(len(rate)):
+                    rate[idx]=self._member_rate(idx, now)
+                self._resum(now)
+            else:
+                total=self.total
+                for idx in dirty:
+                    new=self._member_rate(idx, now)
+                    old=rate[idx]
+                    if new!=old:
+                        rate[idx]=new
+                        self._enabled_cnt+=(new>0)-(old>0)
+                        self.total+=new-old
+                        self._tree.set(idx, new)
+                        self._update_cnt+=1
+                if self.total!=total:
+                    if (self._update_cnt>=len(rate) or
+                            (self._enabled_cnt>0)!=(self.total>0)):
+                        # Re-sum now and then so roundoff can't accumulate.
+                        self._resum(now)
+                    elif self._enabled_cnt>0:
+                        self._current=ExponentialDistribution(self.total, now)
+                    else:
+                        self._current=None
+        if self._current is not None:
+            return (True, self._current)
+        else:
+            return (False, None)
+
+    def _resum(self, now):
+        self._tree.values[:]=self.rate
+        self._tree.rebuild()
+        self.total=self._tree.total()
+        self._enabled_cnt=len(self.rate)-self.rate.count(0.0)
+        self._update_cnt=0
+        if self._enabled_cnt>0:
+            self._current=ExponentialDistribution(self.total, now)
+        else:
+            self._current=None
+
+    def fire(self, now, rng):
+        if self._dirty:
+            # Members may have changed since the last enabled(),
+            # and a disabled one must never be chosen.
+            self.enabled(now)
+        chosen=self._tree.find(rng.uniform(0, 1)*self.total)
+        if self.rate[chosen]<=0:
+            # Roundoff in the partial sums pointed past the last rate.
+            self._resum(now)
+            chosen=self._tree.find(rng.uniform(0, 1)*self.total)
+        self.last_fired=self.members[chosen]
+        changed=self.last_fired.fire(now, rng)
+        # Tell LLCP which places the member changed, which may
+        # be fewer than those affected by the whole group.
+        if changed is None:
+            changed=self.last_fired.affected()
+        return changed
+
+
+def exchangeable_key(transition):
+    """
+    The default grouping for LLCP.lump(). Transitions of the same class
+    that affect the same places are assumed to change them the same way.
+    """
+    return (type(transition), tuple(id(p) for p in transition.affected()))
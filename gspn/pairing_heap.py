@@ -294,6 +294,32 @@ class pairing_heap:
         # Link it with the root
         self._root = self._link(node, self._root)
 
+    def update(self, node, item):
+        """Change the value of node to item, in either direction.
+
+        A decrease is the same as .adjust_key().  For an increase,
+        the node is cut out, its children are linked back into the
+        heap, and the node itself is relinked with the root, reusing
+        the node instead of deleting it and inserting a new one.
+
+        If node is not part of this heap, both heaps may become gibberish.
+        """
+        self._check_heap_node (node)
+        if not self._gt(item, node._item):
+            if self._gt(node._item, item):
+                self.adjust_key(node, item)
+            else:
+                node._item = item
+            return
+        if id(self._root) == id(node):
+            self._root = node._extract(self)
+        else:
+            node._cut()
+            self._root = self._link(node._extract(self), self._root)
+        node._clean()
+        node._item = item
+        self._root = self._link(node, self._root)
+
     def delete(self, node):
         """Delete a node from the middle of the heap.
 
@@ -1,41 +1,82 @@
 import logging
 import numpy as np
-import scipy.stats
 
 logger=logging.getLogger(__file__)
 
-def poisson_point_process_2D(lam, bounds):
+# Each generator takes an rng, either a numpy.random.Generator,
+# a RandomState or the numpy.random module itself, which is the default.
+# Every draw is one call for all points, so generating millions of
+# points takes a few calls to NumPy.
+
+def poisson_point_process_2D(lam, bounds, rng=np.random):
     """
     lam is the intensity.
     bounds are (xlow, xhigh, ylow, yhigh).
     Used this article.
     http://connor-johnson.com/2014/02/25/spatial-point-processes/
     """
-    N=scipy.stats.poisson(lam*(bounds[1]-bounds[0])*(bounds[3]-bounds[2])).rvs()
+    N=rng.poisson(lam*(bounds[1]-bounds[0])*(bounds[3]-bounds[2]))
     logger.debug("{0} points".format(N))
-    x=scipy.stats.uniform.rvs(loc=bounds[0], scale=(bounds[1]-bounds[0]),
-        size=((N, 1)))
-    y=scipy.stats.uniform.rvs(loc=bounds[2], scale=(bounds[3]-bounds[2]),
-        size=((N, 1)))
-    return np.hstack((x, y))
+    x=rng.uniform(bounds[0], bounds[1], N)
+    y=rng.uniform(bounds[2], bounds[3], N)
+    return np.column_stack((x, y))
 
 
-def thomas_point_process_2D(kappa, sigma, mu, bounds):
+def thomas_point_process_2D(kappa, sigma, mu, bounds, rng=np.random):
     """
     kappa is the intensity of the high-level process.
-    sigma is the Gaussian variance.
-    mu is the intensity of the low-level process.
-    bounds are (xlow, xhigh, ylow, yhigh).
+    sigma is the standard deviation of the Gaussian around each parent.
+    mu is the mean number of children of each parent.
+    bounds are (xlow, xhigh, ylow, yhigh), which bound the parents.
+    Children may fall outside them.
     Used this article.
     http://connor-johnson.com/2014/02/25/spatial-point-processes/
     """
-    parents=poisson_point_process_2D(kappa, bounds)
-    parent_cnt=parents.shape[0]
-    list_of_arrays=list()
-    sub_scale=np.array([sigma, sigma])
-    for i in range(parent_cnt):
-        children_cnt=scipy.stats.poisson(mu).rvs()
-        pdf=scipy.stats.norm(loc=np.array(parents[i, :2]), scale=sub_scale)
-        list_of_arrays.append(pdf.rvs((children_cnt, 2)))
-    return np.vstack(list_of_arrays)
+    parents=poisson_point_process_2D(kappa, bounds, rng)
+    children_cnt=rng.poisson(mu, parents.shape[0])
+    centers=np.repeat(parents, children_cnt, axis=0)
+    return centers+rng.normal(0, sigma, centers.shape)
+
+
+def matern_point_process_2D(kappa, radius, mu, bounds, rng=np.random):
+    """
+    A Matern cluster process. kappa is the intensity of parents
+    within bounds, (xlow, xhigh, ylow, yhigh), and each parent has
+    a Poisson number of children, with mean mu, uniform in
+    a disc of the given radius around it.
+    """
+    parents=poisson_point_process_2D(kappa, bounds, rng)
+    children_cnt=rng.poisson(mu, parents.shape[0])
+    centers=np.repeat(parents, children_cnt, axis=0)
+    total=centers.shape[0]
+    r=radius*np.sqrt(rng.uniform(0, 1, total))
+    angle=rng.uniform(0, 2*np.pi, total)
+    return centers+np.column_stack((r*np.cos(angle), r*np.sin(angle)))
+
 
+def tiled_point_process_2D(process, parameters, bounds, tile, seed):
+    """
+    Yields (tile_bounds, points) for each square tile of side tile
+    covering bounds, generating points with
+    process(*parameters, tile_bounds, rng), for instance
+    tiled_point_process_2D(thomas_point_process_2D, (kappa, sigma, mu),
+    bounds, 10.0, 23). Only one tile is in memory at a time.
+
+    Each tile has its own generator, seeded from seed and the tile's
+    column and row, so a tile's points don't depend on the order
+    in which tiles are read or on which other tiles are read.
+    Parents of the cluster processes are Poisson in each tile,
+    so together they are the same process over all of bounds,
+    and each child is yielded with its parent's tile.
+    """
+    x_cnt=int(np.ceil((bounds[1]-bounds[0])/tile))
+    y_cnt=int(np.ceil((bounds[3]-bounds[2])/tile))
+    for x_idx in range(x_cnt):
+        for y_idx in range(y_cnt):
+            xlow=bounds[0]+x_idx*tile
+            ylow=bounds[2]+y_idx*tile
+            tile_bounds=(xlow, min(xlow+tile, bounds[1]),
+                ylow, min(ylow+tile, bounds[3]))
+            rng=np.random.default_rng(
+                np.random.SeedSequence(seed, spawn_key=(x_idx, y_idx)))
+            yield tile_bounds, process(*(tuple(parameters)+(tile_bounds, rng)))
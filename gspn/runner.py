@@ -1,4 +1,8 @@
 import logging
+import concurrent.futures
+import numpy as np
+import gspn.sample
+from gspn.buffered import BufferedRandom
 
 
 logger=logging.getLogger(__file__)
@@ -21,3 +25,45 @@ class RunnerFSM(object):
                 running=self.observer(transition, when)
             else:
                 running=False
+
+
+def _run_replicate(builder, observer_factory, sampler, seed):
+    rng=BufferedRandom(np.random.default_rng(seed))
+    net=builder()
+    observer=observer_factory()
+    run=RunnerFSM(sampler(net, rng), observer)
+    run.init()
+    run.run()
+    return observer.summary()
+
+
+class ReplicateRunner(object):
+    """
+    Runs independent replicates of a model across a pool of processes.
+    builder() returns a fresh net, such as an LLCP.
+    observer_factory() returns an observer for RunnerFSM, which must
+    also have a method summary() returning the compact result that
+    is sent back from the worker. builder, observer_factory and
+    sampler must be picklable, so define them at module level
+    or use functools.partial.
+
+    Replicate i always uses the i-th stream spawned from
+    numpy.random.SeedSequence(seed), wrapped in a BufferedRandom,
+    so results depend on the seed but not on the number of workers.
+    """
+    def __init__(self, builder, observer_factory,
+            sampler=gspn.sample.NextReaction):
+        self.builder=builder
+        self.observer_factory=observer_factory
+        self.sampler=sampler
+
+    def run(self, replicate_cnt, seed, workers=None):
+        """
+        Returns the list of summaries, in order of replicate.
+        """
+        streams=np.random.SeedSequence(seed).spawn(replicate_cnt)
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            futures=[executor.submit(_run_replicate, self.builder,
+                self.observer_factory, self.sampler, stream)
+                for stream in streams]
+            return [f.result() for f in futures]
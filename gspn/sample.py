@@ -1,6 +1,10 @@
+import copy
 import logging
 import math
+import numpy as np
 import gspn.pairing_heap
+import gspn.fenwick
+from gspn.distributions import ExponentialDistribution
 
 logger=logging.getLogger("gspn/sample")
 
@@ -22,7 +26,16 @@ class FirstReaction:
         return self.least
 
     def fire(self, transition, when):
-        self.system.fire(transition, when)
+        self.system.fire(transition, when, self.rng)
+
+    def snapshot(self):
+        return {"system" : self.system.snapshot()}
+
+    def restore(self, snapshot, resample=False):
+        """
+        Every step samples afresh, so resample changes nothing.
+        """
+        self.system.restore(snapshot["system"])
 
     def _sample_trans(self, transition, distribution, now):
         trial_time=distribution.sample(now, self.rng)
@@ -32,26 +45,275 @@ class FirstReaction:
         # else forget it
 
 
+class DirectMethod:
+    """
+    Gillespie's direct method. The rates of enabled transitions
+    are kept in a Fenwick tree, indexed by transition id, so that
+    choosing the next transition takes two random numbers and
+    O(log n) time. Every enabled transition must have an
+    ExponentialDistribution.
+    """
+    def __init__(self, system, rng):
+        self.system=system
+        self.rng=rng
+
+    def init(self):
+        self.propensity=gspn.fenwick.FenwickTree(len(self.system.t))
+        self.system.init(self._observe)
+
+    def next(self):
+        total=self.propensity.total()
+        if total<=0:
+            return (None, None)
+        when=self.system.current_time()+self.rng.exponential()/total
+        chosen=self.propensity.find(self.rng.uniform(0, 1)*total)
+        if self.propensity.values[chosen]<=0:
+            # Roundoff in the partial sums pointed past the last rate.
+            self.propensity.rebuild()
+            chosen=self.propensity.find(
+                self.rng.uniform(0, 1)*self.propensity.total())
+        return (self.system.t[chosen], when)
+
+    def fire(self, transition, when):
+        self.system.fire(transition, when, self.rng, self._observe)
+
+    def snapshot(self):
+        return {"system" : self.system.snapshot(),
+            "propensity" : copy.deepcopy(self.propensity)}
+
+    def restore(self, snapshot, resample=False):
+        """
+        Every step samples afresh, so resample changes nothing.
+        """
+        self.system.restore(snapshot["system"])
+        self.propensity=copy.deepcopy(snapshot["propensity"])
+
+    def _observe(self, transition, olddist, newdist, firing, now):
+        if transition._id>=len(self.propensity):
+            self.propensity.grow(max(transition._id+1,
+                2*len(self.propensity)))
+        if newdist is None:
+            self.propensity.set(transition._id, 0.0)
+        elif isinstance(newdist, ExponentialDistribution):
+            self.propensity.set(transition._id, newdist.lam)
+        else:
+            raise RuntimeError(("DirectMethod requires an "+
+                "ExponentialDistribution but transition {0} "+
+                "has a {1}").format(transition, type(newdist).__name__))
+
+
+class CompositionRejection:
+    """
+    The composition-rejection method of Slepoy, Thompson and Plimpton.
+    Enabled transitions are grouped by rate into power-of-two buckets,
+    so that every rate in bucket e lies in [2^(e-1), 2^e).
+    Choosing the next transition picks a bucket in proportion to
+    its summed rate, then picks members of the bucket uniformly,
+    accepting one with probability rate/2^e, which takes fewer than
+    two tries on average. The number of buckets depends on the
+    range of rates, not the number of transitions, so selection
+    is O(1) expected. Every enabled transition must have an
+    ExponentialDistribution.
+    """
+    def __init__(self, system, rng):
+        self.system=system
+        self.rng=rng
+
+    def init(self):
+        transition_cnt=len(self.system.t)
+        self.rate=np.zeros(transition_cnt, dtype=np.double)
+        self._bucket=np.zeros(transition_cnt, dtype=np.int64)
+        self._slot=np.full(transition_cnt, -1, dtype=np.int64)
+        self._members=dict()
+        self._sum=dict()
+        self.system.init(self._observe)
+
+    def next(self):
+        total=0.0
+        for bucket_sum in self._sum.values():
+            total+=bucket_sum
+        if total<=0:
+            return (None, None)
+        when=self.system.current_time()+self.rng.exponential()/total
+        u=self.rng.uniform(0, 1)*total
+        for bucket, bucket_sum in self._sum.items():
+            u-=bucket_sum
+            if u<0:
+                break
+        members=self._members[bucket]
+        bound=math.ldexp(1.0, bucket)
+        while True:
+            r=self.rng.uniform(0, 1)*len(members)
+            idx=int(r)
+            if (r-idx)*bound<self.rate[members[idx]]:
+                return (self.system.t[members[idx]], when)
+
+    def fire(self, transition, when):
+        self.system.fire(transition, when, self.rng, self._observe)
+
+    def snapshot(self):
+        return {"system" : self.system.snapshot(),
+            "buckets" : copy.deepcopy((self.rate, self._bucket, self._slot,
+                self._members, self._sum))}
+
+    def restore(self, snapshot, resample=False):
+        """
+        Every step samples afresh, so resample changes nothing.
+        """
+        self.system.restore(snapshot["system"])
+        (self.rate, self._bucket, self._slot, self._members,
+            self._sum)=copy.deepcopy(snapshot["buckets"])
+
+    def _observe(self, transition, olddist, newdist, firing, now):
+        if newdist is None:
+            rate=0.0
+        elif isinstance(newdist, ExponentialDistribution):
+            rate=newdist.lam
+        else:
+            raise RuntimeError(("CompositionRejection requires an "+
+                "ExponentialDistribution but transition {0} "+
+                "has a {1}").format(transition, type(newdist).__name__))
+        transition_id=transition._id
+        if transition_id>=self.rate.shape[0]:
+            self._grow(transition_id+1)
+        if rate==self.rate[transition_id]:
+            return
+        if self._slot[transition_id]>=0:
+            self._remove(transition_id)
+        self.rate[transition_id]=rate
+        if rate>0:
+            self._add(transition_id)
+
+    def _grow(self, cnt):
+        """
+        Makes room for transitions added after init.
+        """
+        extra=max(cnt, 2*self.rate.shape[0])-self.rate.shape[0]
+        self.rate=np.hstack([self.rate, np.zeros(extra, dtype=np.double)])
+        self._bucket=np.hstack([self._bucket,
+            np.zeros(extra, dtype=np.int64)])
+        self._slot=np.hstack([self._slot, np.full(extra, -1, dtype=np.int64)])
+
+    def _add(self, transition_id):
+        rate=self.rate[transition_id]
+        bucket=math.frexp(rate)[1]
+        if bucket not in self._members:
+            self._members[bucket]=list()
+            self._sum[bucket]=0.0
+        members=self._members[bucket]
+        self._bucket[transition_id]=bucket
+        self._slot[transition_id]=len(members)
+        members.append(transition_id)
+        self._sum[bucket]+=rate
+
+    def _remove(self, transition_id):
+        bucket=self._bucket[transition_id]
+        members=self._members[bucket]
+        slot=self._slot[transition_id]
+        last=members.pop()
+        if last!=transition_id:
+            members[slot]=last
+            self._slot[last]=slot
+        self._slot[transition_id]=-1
+        if members:
+            self._sum[bucket]-=self.rate[transition_id]
+        else:
+            # Forget accumulated roundoff along with the bucket.
+            del self._members[bucket]
+            del self._sum[bucket]
+
+
 class NextReactionRecord:
+    """
+    Per-transition clock state as NextReaction once stored it on each
+    transition. NextReaction now keeps these in arrays indexed by
+    transition id, and this class remains only so code that imports
+    it keeps working.
+    """
     def __init__(self):
         self.remaining_exponential_interval=None
         self.last_modification_time=0.0
         self.heap_entry=None
 
 
+class PairingHeapQueue:
+    """
+    Presents the pairing heap with the same interface as
+    gspn.indexed_heap.IndexedHeap, where each entry is
+    an integer item with a floating point key.
+    """
+    def __init__(self):
+        self.heap=gspn.pairing_heap.pairing_heap()
+        self.node=dict()
+
+    def clear(self):
+        self.heap=gspn.pairing_heap.pairing_heap()
+        self.node=dict()
+
+    def copy(self):
+        other=PairingHeapQueue()
+        for item, node in self.node.items():
+            other.insert(item, node.value()[0])
+        return other
+
+    def empty(self):
+        return self.heap.empty()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __contains__(self, item):
+        return item in self.node
+
+    def peek(self):
+        return self.heap.peek()
+
+    def key(self, item):
+        return self.node[item].value()[0]
+
+    def insert(self, item, key):
+        self.node[item]=self.heap.insert((key, item))
+
+    def update(self, item, key):
+        self.heap.update(self.node[item], (key, item))
+
+    def delete(self, item):
+        self.heap.delete(self.node.pop(item))
+
+
 class NextReaction:
-    def __init__(self, system, rng):
-        self.priority=gspn.pairing_heap.pairing_heap()
+    """
+    Gibson and Bruck's next reaction method, generalized by Anderson
+    to non-exponential distributions. The priority queue holds
+    transition ids keyed by firing time. It defaults to a pairing heap,
+    but a gspn.indexed_heap.IndexedHeap is much faster for large nets.
+
+    The state of each transition's clock is kept in arrays indexed
+    by transition id, so that transitions carry nothing for the sampler
+    and two samplers can share a net. remaining is the unit exponential
+    interval left to each transition, NaN until its first enabling,
+    modified the last time it was charged for elapsed hazard,
+    and queued whether it is in the priority queue.
+    """
+    def __init__(self, system, rng, priority=None):
+        if priority is None:
+            priority=PairingHeapQueue()
+        self.priority=priority
         self.system=system
         self.rng=rng
 
     def init(self):
+        self.priority.clear()
+        cnt=len(self.system.t)
+        self.remaining=np.full(cnt, np.nan, dtype=np.double)
+        self.modified=np.zeros(cnt, dtype=np.double)
+        self.queued=np.zeros(cnt, dtype=bool)
         self.system.init(self._observe)
 
     def next(self):
         if not self.priority.empty():
-            v=self.priority.peek()
-            return (v[1], v[0])
+            when, transition_id=self.priority.peek()
+            return (self.system.t[transition_id], when)
         return (None, None)
 
 
@@ -63,15 +325,17 @@ class NextReaction:
         with stoichiometries, these can all be calculated.
         now is the current time.
         future_fire is the firing time of the next event.
+        For a whole trajectory, gspn.LikelihoodEngine is much faster.
         """
-        log_likelihood=np.double()
-        for firing_time, enabled_transition in self.priority:
+        totals=[0.0, 0.0]
+        def accumulate(enabled_transition, distribution, current):
             if enabled_transition in transitions:
-                log_likelihood+=enabled_transition.loglikelihood(now, future_fire)
-            int_haz=enabled_transition._distribution.hazard_integral(
-                now, future_fire)
-            log_likelihood-=int_haz
-        return log_likelihood
+                totals[0]+=distribution.hazard(future_fire)
+            totals[1]+=distribution.hazard_integral(now, future_fire)
+        self.system.enabled_transitions(accumulate)
+        if totals[0]<=0:
+            return -float("inf")
+        return np.log(totals[0])-totals[1]
 
 
     def integrated_hazard(self, transitions, cumulative, now, future):
@@ -85,61 +349,97 @@ class NextReaction:
         it to the cumulative array depending on its locations
         in transitions.
         """
-        for firing_time, enabled_transition in self.priority:
-            if enabled_transition in transitions.keys():
-                int_haz=enabled_transition._distribution.hazard_integral(
-                    now, future)
+        def accumulate(enabled_transition, distribution, current):
+            if enabled_transition in transitions:
+                int_haz=distribution.hazard_integral(now, future)
                 for idx in transitions[enabled_transition]:
                     cumulative[idx]+=int_haz
+        self.system.enabled_transitions(accumulate)
 
 
     def fire(self, transition, when):
         self.system.fire(transition, when, self.rng, self._observe)
 
 
+    def snapshot(self):
+        """
+        The state of the net and of every clock, for restore().
+        """
+        return {
+            "system" : self.system.snapshot(),
+            "priority" : self.priority.copy(),
+            "remaining" : self.remaining.copy(),
+            "modified" : self.modified.copy(),
+            "queued" : self.queued.copy()
+        }
+
+    def restore(self, snapshot, resample=False):
+        """
+        Returns the net and the sampler to a snapshot. Without resample,
+        the same random numbers give the same continuation. With
+        resample, each transition's remaining unit exponential interval
+        is drawn again, which, because the hazard already elapsed is
+        accounted for, gives an independent continuation from the same
+        state. That is what branching runs need.
+        """
+        self.system.restore(snapshot["system"])
+        self.remaining=snapshot["remaining"].copy()
+        self.modified=snapshot["modified"].copy()
+        self.queued=snapshot["queued"].copy()
+        if not resample:
+            self.priority=snapshot["priority"].copy()
+            return
+        # Transitions not now enabled draw again when next enabled.
+        self.remaining[~self.queued]=np.nan
+        self.priority.clear()
+        self.system.enabled_transitions(self._resample)
+
+    def _resample(self, transition, distribution, now):
+        idx=transition._id
+        self.remaining[idx]=self.rng.exponential()
+        self.modified[idx]=now
+        self.priority.insert(idx,
+            distribution.implicit_hazard_integral(self.remaining[idx], now))
+
+
     def _observe(self, transition, olddist, newdist, firing, now):
+        idx=transition._id
+        if idx>=self.remaining.shape[0]:
+            self._grow(idx+1)
         if newdist is not None:
-            if "_nr" in transition.__dict__:
-                record=transition._nr
-                if record.heap_entry is not None:
-                    time_penalty=olddist.hazard_integral(
-                        record.last_modification_time, now)
-                    record.remaining_exponential_interval-=time_penalty
-                # else: transition was disabled previously
-                when_fire=newdist.implicit_hazard_integral(
-                    record.remaining_exponential_interval, now)
-                if record.heap_entry is not None:
-                    if when_fire<record.heap_entry._item[0]:
-                        self.priority.adjust_key(record.heap_entry,
-                            (when_fire, transition))
-                    else:
-                        self.priority.delete(record.heap_entry)
-                        record.heap_entry=self.priority.insert(
-                            (when_fire, transition))
-                else:
-                    record.heap_entry=self.priority.insert(
-                        (when_fire, transition))
-                record.last_modification_time=now
+            if self.queued[idx]:
+                self.remaining[idx]-=olddist.hazard_integral(
+                    self.modified[idx], now)
+            elif self.remaining[idx]!=self.remaining[idx]:
+                # NaN, so this transition has never been enabled.
+                self.remaining[idx]=self.rng.exponential()
+            when_fire=newdist.implicit_hazard_integral(
+                self.remaining[idx], now)
+            if self.queued[idx]:
+                self.priority.update(idx, when_fire)
             else:
-                interval=-math.log(self.rng.uniform(0, 1))
-                firing_time=newdist.implicit_hazard_integral(
-                    interval, now)
-                transition._nr=NextReactionRecord()
-                transition._nr.remaining_exponential_interval=interval
-                transition._nr.last_modification_time=now
-                transition._nr.heap_entry=self.priority.insert(
-                    (firing_time, transition))
+                self.queued[idx]=True
+                self.priority.insert(idx, when_fire)
+            self.modified[idx]=now
         else:
-            record=transition._nr
-            self.priority.delete(transition._nr.heap_entry)
-            transition._nr.heap_entry=None
+            self.priority.delete(idx)
+            self.queued[idx]=False
             if not firing:
-                time_penalty=olddist.hazard_integral(
-                    transition._nr.last_modification_time, now)
-                transition._nr.remaining_exponential_interval-=time_penalty
-                transition._nr.last_modification_time=now
+                self.remaining[idx]-=olddist.hazard_integral(
+                    self.modified[idx], now)
             else:
-                transition._nr.interval=-math.log(self.rng.uniform(0, 1))
-                transition._nr.last_modification_time=now
+                self.remaining[idx]=self.rng.exponential()
+            self.modified[idx]=now
+
+    def _grow(self, cnt):
+        """
+        Makes room for transitions added after init.
+        """
+        extra=max(cnt, 2*self.remaining.shape[0])-self.remaining.shape[0]
+        self.remaining=np.hstack([self.remaining,
+            np.full(extra, np.nan, dtype=np.double)])
+        self.modified=np.hstack([self.modified,
+            np.zeros(extra, dtype=np.double)])
+        self.queued=np.hstack([self.queued, np.zeros(extra, dtype=bool)])
 
 
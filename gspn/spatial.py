@@ -0,0 +1,305 @@
+import logging
+import numpy as np
+import scipy.spatial
+from gspn.llcp import LLCP
+from gspn.distributions import ExponentialDistribution
+
+logger=logging.getLogger(__file__)
+
+# An SIR model of units, such as farms, at points in the plane,
+# where infection passes between pairs of units at a rate that
+# is a function of their distance. Only pairs closer than a cutoff
+# get a transition, so the net grows with the number of neighbors,
+# not the square of the number of units.
+
+
+def neighbor_pairs(points, cutoff):
+    """
+    Finds every pair of points closer than cutoff with a KD-tree.
+    Returns arrays (source, target, distance) with each pair
+    in both orders.
+    """
+    points=np.asarray(points, dtype=np.double)
+    tree=scipy.spatial.cKDTree(points)
+    pairs=tree.query_pairs(cutoff, output_type="ndarray")
+    source=np.concatenate((pairs[:, 0], pairs[:, 1]))
+    target=np.concatenate((pairs[:, 1], pairs[:, 0]))
+    distance=np.sqrt(np.sum((points[source]-points[target])**2, axis=1))
+    return source, target, distance
+
+
+class UnitPlace:
+    """
+    The count, zero or one, of a unit in one disease state.
+    """
+    def __init__(self, unit, state):
+        self.unit=unit
+        self.state=state
+        self.count=0
+
+
+class KernelInfectTransition:
+    """
+    Infection of one unit by another, at a rate given by the kernel.
+    """
+    def __init__(self, i0, s1, i1, rate):
+        self.i0=i0
+        self.s1=s1
+        self.i1=i1
+        self.rate=rate
+
+    def depends(self):
+        return [self.i0, self.s1]
+
+    def affected(self):
+        return [self.s1, self.i1]
+
+    def stoichiometry(self):
+        return [(self.s1, -1), (self.i1, 1)]
+
+    def mass_action(self):
+        return self.rate
+
+    def enabled(self, now):
+        if self.i0.count>0 and self.s1.count>0:
+            return (True, ExponentialDistribution(self.rate, now))
+        else:
+            return (False, None)
+
+    def fire(self, now, rng):
+        self.s1.count=0
+        self.i1.count=1
+
+
+class UnitRecoverTransition:
+    def __init__(self, i, r, rate):
+        self.i=i
+        self.r=r
+        self.rate=rate
+
+    def depends(self):
+        return [self.i]
+
+    def affected(self):
+        return [self.i, self.r]
+
+    def stoichiometry(self):
+        return [(self.i, -1), (self.r, 1)]
+
+    def mass_action(self):
+        return self.rate
+
+    def enabled(self, now):
+        if self.i.count>0:
+            return (True, ExponentialDistribution(self.rate, now))
+        else:
+            return (False, None)
+
+    def fire(self, now, rng):
+        self.i.count=0
+        self.r.count=1
+
+
+def BuildKernelSIR(points, kernel, cutoff, recovery_rate, infected):
+    """
+    points is an array of unit locations, one row per unit, such as
+    the output of poisson_point_process_2D. kernel takes an array
+    of distances and returns an array of infection rates. Pairs
+    farther apart than cutoff don't interact. infected lists the
+    units that start infected; the rest start susceptible.
+
+    Returns the frozen LLCP and an array of places shaped (units, 3),
+    with columns for susceptible, infected and recovered.
+    """
+    unit_cnt=len(points)
+    places=np.empty((unit_cnt, 3), dtype=object)
+    for unit_idx in range(unit_cnt):
+        for state_idx, state in enumerate(["s", "i", "r"]):
+            places[unit_idx, state_idx]=UnitPlace(unit_idx, state)
+    net=LLCP()
+    net.add_places(list(places.ravel()))
+
+    source, target, distance=neighbor_pairs(points, cutoff)
+    rate=np.asarray(kernel(distance), dtype=np.double)
+    logger.debug("{0} units with {1} infectious pairs".format(unit_cnt,
+        source.shape[0]))
+    net.add_transitions([UnitRecoverTransition(places[u, 1], places[u, 2],
+        recovery_rate) for u in range(unit_cnt)])
+    net.add_transitions([KernelInfectTransition(places[a, 1], places[b, 0],
+        places[b, 1], r) for (a, b, r) in
+        zip(source.tolist(), target.tolist(), rate.tolist()) if r>0])
+    net.freeze()
+
+    start=np.zeros(unit_cnt, dtype=bool)
+    start[list(infected)]=True
+    for unit_idx in range(unit_cnt):
+        places[unit_idx, 1 if start[unit_idx] else 0].count=1
+    return net, places
+
+
+# The grid version of the same model groups units into square cells.
+# Instead of a transition for each pair of units, there is one for
+# each pair of cells, firing at an upper bound on the rate between
+# any infected unit of one and any susceptible unit of the other.
+# When it fires, it picks such a pair of units at random and infects
+# the target with probability kernel(distance)/bound, so candidate
+# events are thinned to exactly the per-pair rates, as in the
+# conditional subsampling of Keeling and Rohani.
+
+
+class UnitSetPlace:
+    """
+    The units of one cell in one disease state, in a list so that
+    one can be drawn at random and removed by swapping with the last.
+    """
+    def __init__(self, cell, state):
+        self.cell=cell
+        self.state=state
+        self.units=list()
+
+    def draw(self, rng):
+        idx=int(rng.uniform(0, 1)*len(self.units))
+        return min(idx, len(self.units)-1)
+
+    def remove(self, idx):
+        unit=self.units[idx]
+        last=self.units.pop()
+        if idx<len(self.units):
+            self.units[idx]=last
+        return unit
+
+
+class CellInfectTransition:
+    """
+    Infection from the infected units of one cell to the susceptible
+    units of another, or the same, cell. bound must be at least the
+    kernel at the distance of any pair of units in the two cells.
+    Pairs farther apart than cutoff are always rejected.
+    After each firing, accepted is True if the candidate infection
+    happened and False if it was thinned away.
+    """
+    def __init__(self, i0, s1, i1, bound, kernel, points, cutoff):
+        self.i0=i0
+        self.s1=s1
+        self.i1=i1
+        self.bound=bound
+        self.kernel=kernel
+        self.points=points
+        self.cutoff=cutoff
+        self.accepted=False
+
+    def depends(self):
+        return [self.i0, self.s1]
+
+    def affected(self):
+        return [self.s1, self.i1]
+
+    def enabled(self, now):
+        pair_cnt=len(self.i0.units)*len(self.s1.units)
+        if pair_cnt>0:
+            return (True, ExponentialDistribution(self.bound*pair_cnt, now))
+        else:
+            return (False, None)
+
+    def fire(self, now, rng):
+        source=self.i0.units[self.i0.draw(rng)]
+        target_idx=self.s1.draw(rng)
+        target=self.s1.units[target_idx]
+        distance=np.sqrt(np.sum((self.points[source]-self.points[target])**2))
+        if (distance>self.cutoff or
+                rng.uniform(0, 1)*self.bound>=self.kernel(distance)):
+            self.accepted=False
+            return list()
+        self.accepted=True
+        self.i1.units.append(self.s1.remove(target_idx))
+        return [self.s1, self.i1]
+
+
+class CellRecoverTransition:
+    """
+    Recovery of any one infected unit in a cell, at rate times
+    the number infected, which is exact for exponential recovery.
+    """
+    def __init__(self, i, r, rate):
+        self.i=i
+        self.r=r
+        self.rate=rate
+
+    def depends(self):
+        return [self.i]
+
+    def affected(self):
+        return [self.i, self.r]
+
+    def enabled(self, now):
+        if self.i.units:
+            return (True, ExponentialDistribution(
+                self.rate*len(self.i.units), now))
+        else:
+            return (False, None)
+
+    def fire(self, now, rng):
+        self.r.units.append(self.i.remove(self.i.draw(rng)))
+
+
+def BuildGridKernelSIR(points, kernel, cell_size, recovery_rate, infected,
+        cutoff=float("inf")):
+    """
+    The same model as BuildKernelSIR, with units grouped into square
+    cells of side cell_size. kernel must not increase with distance,
+    so that its value at the least distance between two cells bounds
+    every pair of units in them, and must accept a scalar distance.
+    Units farther apart than cutoff don't interact.
+    The cost of an event depends on the number of cells, not units.
+
+    Infections are thinned, so every candidate, accepted or not, is
+    a firing of a CellInfectTransition, and observers, recorders and
+    likelihoods see rejected candidates as firings too. Check the
+    transition's accepted member to tell real infections apart.
+
+    Returns the frozen LLCP and a dictionary from each occupied cell,
+    a pair of integer grid indices, to its places for susceptible,
+    infected and recovered units.
+    """
+    points=np.asarray(points, dtype=np.double)
+    grid=np.floor((points-points.min(axis=0))/cell_size).astype(np.int64)
+    occupied, unit_cell=np.unique(grid, axis=0, return_inverse=True)
+    unit_cell=unit_cell.ravel()
+    cells=dict()
+    place_list=list()
+    for cell_idx in range(occupied.shape[0]):
+        cell=tuple(occupied[cell_idx].tolist())
+        cells[cell]=[UnitSetPlace(cell, state) for state in ["s", "i", "r"]]
+        place_list.extend(cells[cell])
+    net=LLCP()
+    net.add_places(place_list)
+
+    start=np.zeros(points.shape[0], dtype=bool)
+    start[list(infected)]=True
+    for unit_idx in range(points.shape[0]):
+        place=cells[tuple(occupied[unit_cell[unit_idx]].tolist())]
+        place[1 if start[unit_idx] else 0].units.append(unit_idx)
+
+    # Cells whose least distance is within cutoff have centers within
+    # cutoff plus a diagonal of each other.
+    reach=cutoff+np.sqrt(2)*cell_size
+    source, target, center_distance=neighbor_pairs(occupied*cell_size, reach)
+    cell_cnt=occupied.shape[0]
+    source=np.concatenate((np.arange(cell_cnt), source))
+    target=np.concatenate((np.arange(cell_cnt), target))
+    gap=np.maximum(np.abs(occupied[source]-occupied[target])-1, 0)*cell_size
+    least=np.sqrt(np.sum(gap**2, axis=1))
+    transitions=[CellRecoverTransition(cells[c][1], cells[c][2],
+        recovery_rate) for c in [tuple(o) for o in occupied.tolist()]]
+    for a, b, d in zip(source.tolist(), target.tolist(), least.tolist()):
+        bound=kernel(d)
+        if d<=cutoff and bound>0:
+            a_places=cells[tuple(occupied[a].tolist())]
+            b_places=cells[tuple(occupied[b].tolist())]
+            transitions.append(CellInfectTransition(a_places[1], b_places[0],
+                b_places[1], bound, kernel, points, cutoff))
+    net.add_transitions(transitions)
+    logger.debug("{0} units in {1} cells with {2} transitions".format(
+        points.shape[0], cell_cnt, len(transitions)))
+    net.freeze()
+    return net, cells
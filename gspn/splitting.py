@@ -0,0 +1,94 @@
+import logging
+import numpy as np
+import gspn.sample
+from gspn.runner import RunnerFSM
+
+logger=logging.getLogger(__file__)
+
+
+class FixedEffortSplitting(object):
+    """
+    Estimates the probability of a rare event, such as a large
+    outbreak, by fixed-effort multilevel splitting. importance(system)
+    measures progress towards the event from the marking, and levels is
+    an increasing list of thresholds on it, the last of which is the
+    event itself. A trajectory fails if no transition is enabled
+    or if time passes end_time before it reaches the next level.
+
+    Stage k starts effort trajectories, each from a state drawn
+    uniformly from those where stage k-1 first reached its level,
+    and counts the fraction that reach the next level. The first stage
+    starts from the initial marking. The product of these fractions
+    is an unbiased estimate of the probability of the event.
+
+    Trajectories are forked with the sampler's snapshot() and
+    restore(snapshot, resample=True), so any sampler with those two
+    methods works: NextReaction, the default, draws fresh intervals on
+    restore, and FirstReaction, DirectMethod and CompositionRejection
+    sample afresh every step anyway. The estimate's variance is approximated
+    as if the stages were independent,
+    estimate^2 sum_k (1-p_k)/(p_k effort).
+    """
+    def __init__(self, system, rng, importance, levels, effort,
+            end_time=float("inf"), sampler=None):
+        if sampler is None:
+            sampler=gspn.sample.NextReaction(system, rng)
+        self.system=system
+        self.rng=rng
+        self.importance=importance
+        self.levels=levels
+        self.effort=effort
+        self.end_time=end_time
+        self.sampler=sampler
+
+    def run(self):
+        """
+        Returns the estimate. Afterwards, estimate, variance,
+        and level_probability, the fraction of trajectories that
+        reached each level from the one before, are members.
+        """
+        self.sampler.init()
+        starts=[self.sampler.snapshot()]
+        self.level_probability=list()
+        for level in self.levels:
+            hits=list()
+            for trial_idx in range(self.effort):
+                chosen=int(self.rng.uniform(0, 1)*len(starts))
+                start=starts[min(chosen, len(starts)-1)]
+                self.sampler.restore(start, resample=True)
+                if self._reach(level):
+                    hits.append(self.sampler.snapshot())
+            self.level_probability.append(len(hits)/float(self.effort))
+            logger.debug("level {0} reached by {1} of {2}".format(level,
+                len(hits), self.effort))
+            if not hits:
+                break
+            starts=hits
+
+        p=np.array(self.level_probability, dtype=np.double)
+        if len(p)<len(self.levels) or np.any(p==0):
+            self.estimate=0.0
+            self.variance=0.0
+        else:
+            self.estimate=float(np.prod(p))
+            self.variance=float(self.estimate**2*
+                np.sum((1-p)/(p*self.effort)))
+        return self.estimate
+
+    def _reach(self, level):
+        """
+        Runs the current trajectory until it reaches the level,
+        returning True, or fails, returning False.
+        """
+        if self.importance(self.system)>=level:
+            return True
+        reached=[False]
+        def observer(transition, when):
+            if when>self.end_time:
+                return False
+            if self.importance(self.system)>=level:
+                reached[0]=True
+                return False
+            return True
+        RunnerFSM(self.sampler, observer).run()
+        return reached[0]
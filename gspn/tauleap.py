@@ -0,0 +1,140 @@
+import logging
+import math
+import numpy as np
+from gspn.distributions import ExponentialDistribution
+
+logger=logging.getLogger(__file__)
+
+
+class TauLeaping:
+    """
+    Explicit tau-leaping for nets whose places hold integer counts,
+    in a member called count. Every enabled transition must have an
+    ExponentialDistribution and must say how it changes counts
+    with a method stoichiometry(), which returns a list of
+    (place, change) pairs.
+
+    Each leap fires every transition a Poisson-distributed number
+    of times, with the step chosen by the method of Cao, Gillespie
+    and Petzold so that no propensity changes by more than a
+    fraction epsilon of itself. When that step is shorter than a few
+    expected waiting times, counts are small, so the engine takes
+    exact steps of the direct method instead.
+
+    The observer is called as observer(firings, when), where firings
+    is a dictionary from transition to how many times it fired.
+    It returns False to stop the simulation.
+    """
+    def __init__(self, system, rng, observer, epsilon=0.03,
+            exact_threshold=10, exact_steps=100, end_time=float("inf")):
+        self.system=system
+        self.rng=rng
+        self.observer=observer
+        self.epsilon=epsilon
+        self.exact_threshold=exact_threshold
+        self.exact_steps=exact_steps
+        self.end_time=end_time
+
+    def init(self):
+        self.system.init()
+        self._stoichiometry=dict()
+
+    def run(self):
+        running=True
+        while running:
+            enabled, rates=self._propensities()
+            total=rates.sum()
+            if total<=0 or self.system.current_time()>=self.end_time:
+                break
+            tau=self._leap_size(enabled, rates)
+            # When no enabled transition changes a count, nothing
+            # bounds the leap, so step exactly.
+            if math.isinf(tau) or tau*total<self.exact_threshold:
+                running=self._exact(self.exact_steps)
+            else:
+                running=self._leap(enabled, rates, tau)
+
+    def _propensities(self):
+        enabled=list()
+        rates=list()
+        def collect(transition, distribution, now):
+            if not isinstance(distribution, ExponentialDistribution):
+                raise RuntimeError(("TauLeaping requires an "+
+                    "ExponentialDistribution but transition {0} "+
+                    "has a {1}").format(transition,
+                    type(distribution).__name__))
+            enabled.append(transition)
+            rates.append(distribution.lam)
+        self.system.enabled_transitions(collect)
+        return enabled, np.array(rates, dtype=np.double)
+
+    def _changes(self, transition):
+        # Family members reuse the ids of released transitions,
+        # so an entry counts only if it was made for this object.
+        cached=self._stoichiometry.get(transition._id)
+        if cached is None or cached[0] is not transition:
+            cached=(transition, transition.stoichiometry())
+            self._stoichiometry[transition._id]=cached
+        return cached[1]
+
+    def _leap_size(self, enabled, rates):
+        """
+        The largest leap for which the expected change and the standard
+        deviation of the change of every count stay below epsilon
+        times that count, or below one for small counts.
+        """
+        mean=dict()
+        variance=dict()
+        for transition, rate in zip(enabled, rates):
+            for place, change in self._changes(transition):
+                mean[place]=mean.get(place, 0.0)+change*rate
+                variance[place]=variance.get(place, 0.0)+change*change*rate
+        tau=float("inf")
+        for place, mu in mean.items():
+            bound=max(self.epsilon*place.count, 1.0)
+            if mu!=0:
+                tau=min(tau, bound/abs(mu))
+            if variance[place]>0:
+                tau=min(tau, bound*bound/variance[place])
+        return tau
+
+    def _leap(self, enabled, rates, tau):
+        now=self.system.current_time()
+        tau=min(tau, self.end_time-now)
+        while True:
+            fire_cnt=self.rng.poisson(rates*tau)
+            delta=dict()
+            for transition, k in zip(enabled, fire_cnt):
+                if k>0:
+                    for place, change in self._changes(transition):
+                        delta[place]=delta.get(place, 0)+k*change
+            if all(place.count+d>=0 for (place, d) in delta.items()):
+                break
+            # A count went negative, so try a shorter leap.
+            tau*=0.5
+        for place, d in delta.items():
+            place.count+=d
+        now+=tau
+        self.system.advance(list(delta.keys()), now)
+        firings=dict((t, int(k)) for (t, k) in zip(enabled, fire_cnt) if k>0)
+        return self.observer(firings, now)
+
+    def _exact(self, step_cnt):
+        for step_idx in range(step_cnt):
+            enabled, rates=self._propensities()
+            total=rates.sum()
+            if total<=0:
+                return False
+            when=(self.system.current_time()-
+                math.log(self.rng.uniform(0, 1))/total)
+            if when>self.end_time:
+                self.system.advance(list(), self.end_time)
+                return False
+            cumulative=np.cumsum(rates)
+            chosen=min(np.searchsorted(cumulative,
+                self.rng.uniform(0, 1)*total, side="right"), len(enabled)-1)
+            transition=enabled[chosen]
+            self.system.fire(transition, when, self.rng)
+            if not self.observer({transition: 1}, when):
+                return False
+        return True
@@ -0,0 +1,306 @@
+from unittest import TestCase
+import logging
+import numpy as np
+import scipy.integrate
+import scipy.stats
+import gspn
+
+logger=logging.getLogger(__file__)
+
+
+class TestEquality(TestCase):
+    def test_equal_parameters(self):
+        self.assertEqual(gspn.ExponentialDistribution(0.5, 1.0),
+            gspn.ExponentialDistribution(0.5, 3.0))
+        self.assertNotEqual(gspn.ExponentialDistribution(0.5, 1.0),
+            gspn.ExponentialDistribution(0.6, 1.0))
+        self.assertEqual(gspn.WeibullDistribution(1.0, 2.0, 1.0, 0),
+            gspn.WeibullDistribution(1.0, 2.0, 1.0, 0))
+        self.assertNotEqual(gspn.WeibullDistribution(1.0, 2.0, 1.0, 0),
+            gspn.WeibullDistribution(1.0, 2.0, 1.5, 0))
+        self.assertNotEqual(gspn.GammaDistribution(1.0, 2.0, 0.0),
+            gspn.WeibullDistribution(1.0, 2.0, 0.0, 0))
+        self.assertEqual(
+            gspn.PiecewiseConstantDistribution([0, 1, 2], [1, 2, 3], 0.0),
+            gspn.PiecewiseConstantDistribution([0, 1, 2], [1, 2, 3], 0.0))
+        self.assertNotEqual(
+            gspn.PiecewiseLinearDistribution([0, 1, 2], [1, 2, 3], 0.0),
+            gspn.PiecewiseLinearDistribution([0, 1, 2], [1, 2, 4], 0.0))
+        self.assertEqual(len(set([gspn.GammaDistribution(1.0, 2.0, 0.0),
+            gspn.GammaDistribution(1.0, 2.0, 0.0)])), 1)
+
+    def test_table_digest(self):
+        """
+        Long tables are compared by a digest made once, so parameters()
+        doesn't grow with the table.
+        """
+        times=np.linspace(0, 100, 100001)
+        hazards=np.ones(times.shape[0])
+        long_table=gspn.PiecewiseConstantDistribution(times, hazards, 0.0)
+        self.assertEqual(len(long_table.parameters()), 1)
+        self.assertEqual(long_table,
+            gspn.PiecewiseConstantDistribution(times, hazards, 0.0))
+        hazards[-1]=2.0
+        self.assertNotEqual(long_table,
+            gspn.PiecewiseConstantDistribution(times, hazards, 0.0))
+        self.assertNotEqual(
+            gspn.HistogramDistribution([0, 1, 2], [1, 2], 0.0),
+            gspn.HistogramDistribution([0, 1, 3], [1, 2], 0.0))
+
+
+class TestBatch(TestCase):
+    def test_matches_scalar(self):
+        rng=np.random.RandomState(101)
+        cnt=60
+        batch=gspn.MixedBatch(cnt)
+        scalars=list()
+        for idx in range(cnt):
+            te=rng.uniform(0, 2)
+            family=idx%3
+            if family==0:
+                dist=gspn.ExponentialDistribution(rng.uniform(0.1, 3), te)
+            elif family==1:
+                dist=gspn.WeibullDistribution(rng.uniform(0.5, 2),
+                    rng.uniform(0.5, 3), te, 0)
+            else:
+                dist=gspn.GammaDistribution(rng.uniform(0.5, 4),
+                    rng.uniform(0.5, 2), te)
+            batch.set(idx, dist)
+            scalars.append(dist)
+        idx=rng.permutation(cnt)[:40]
+        t0=np.array([scalars[i].te for i in idx])+rng.uniform(0, 1, 40)
+        t1=t0+rng.uniform(0, 2, 40)
+        xa=rng.exponential(size=40)
+        integral=batch.hazard_integral(idx, t0, t1)
+        firing=batch.implicit_hazard_integral(idx, xa, t0)
+        for j, i in enumerate(idx):
+            self.assertAlmostEqual(integral[j],
+                scalars[i].hazard_integral(t0[j], t1[j]), places=8)
+            self.assertAlmostEqual(firing[j],
+                scalars[i].implicit_hazard_integral(xa[j], t0[j]), places=6)
+            self.assertAlmostEqual(scalars[i].hazard_integral(t0[j],
+                firing[j]), xa[j], places=6)
+        when=batch.sample(idx, 3.0, rng)
+        self.assertTrue(np.all(when>=3.0))
+
+    def test_unsupported_family(self):
+        batch=gspn.MixedBatch(4)
+        with self.assertRaises(TypeError):
+            batch.set(0, gspn.UniformDistribution(0, 1, 0))
+
+
+def brute_integral(hazard, t0, t1, cnt=200001):
+    s=np.linspace(t0, t1, cnt)
+    return scipy.integrate.trapezoid(hazard(s), s)
+
+
+class TestPiecewise(TestCase):
+    def check(self, dist, hazard, rng):
+        te=dist.te
+        for i in range(20):
+            t0=te+rng.uniform(-0.5, 4)
+            t1=t0+rng.uniform(0, 6)
+            self.assertAlmostEqual(dist.hazard_integral(t0, t1),
+                brute_integral(hazard, t0, t1), places=4)
+            xa=rng.exponential()
+            t1=dist.implicit_hazard_integral(xa, t0)
+            self.assertAlmostEqual(dist.hazard_integral(t0, t1), xa, places=8)
+        now=te+1.5
+        samples=np.array([dist.sample(now, rng) for i in range(2000)])
+        self.assertTrue(np.all(samples>=now))
+        cdf=lambda t: 1-np.exp(-dist.hazard_integral(now, t))
+        statistic=gspn.distributions.EmpiricalDistribution(
+            samples).compare_theoretical(cdf)
+        self.assertTrue(statistic<1.63)
+        self.assertAlmostEqual(dist.loglikelihood(now, now+0.7),
+            np.log(hazard(np.array([now+0.7]))[0])
+            -dist.hazard_integral(now, now+0.7), places=8)
+
+    def test_constant(self):
+        rng=np.random.RandomState(77)
+        times=[0, 1, 2.5, 3, 5]
+        hazards=[0.2, 1.5, 0.0, 0.7, 0.4]
+        te=2.0
+        def hazard(t):
+            s=t-te
+            idx=np.searchsorted(times, s, side="right")-1
+            return np.where(s<0, 0, np.array(hazards)[np.maximum(idx, 0)])
+        self.check(gspn.PiecewiseConstantDistribution(times, hazards, te),
+            hazard, rng)
+
+    def test_linear(self):
+        rng=np.random.RandomState(78)
+        times=[0, 1, 2.5, 3, 5]
+        hazards=[0.2, 1.5, 0.0, 0.7, 0.4]
+        te=2.0
+        def hazard(t):
+            return np.where(t<te, 0, np.interp(t-te, times, hazards))
+        self.check(gspn.PiecewiseLinearDistribution(times, hazards, te),
+            hazard, rng)
+
+
+class TestTabulated(TestCase):
+    def test_gamma(self):
+        rng=np.random.RandomState(31)
+        gamma=gspn.GammaDistribution(2.5, 1.3, 1.0)
+        table=gspn.tabulated(gamma, tolerance=1e-7)
+        later=gspn.tabulated(gspn.GammaDistribution(2.5, 1.3, 4.0),
+            tolerance=1e-7)
+        self.assertIs(table.table, later.table)
+        self.assertEqual(later.te, 4.0)
+        for i in range(50):
+            t0=1.0+rng.uniform(0, 4)
+            t1=t0+rng.uniform(0, 4)
+            self.assertAlmostEqual(table.hazard_integral(t0, t1),
+                gamma.hazard_integral(t0, t1), delta=1e-6)
+            xa=rng.exponential()
+            self.assertAlmostEqual(gamma.hazard_integral(t0,
+                table.implicit_hazard_integral(xa, t0)), xa, delta=1e-6)
+        samples=np.array([table.sample(2.0, rng) for i in range(2000)])
+        cdf=lambda t: 1-np.exp(-gamma.hazard_integral(2.0, t))
+        statistic=gspn.distributions.EmpiricalDistribution(
+            samples).compare_theoretical(cdf)
+        self.assertTrue(statistic<1.63)
+
+    def test_bounded_hazard(self):
+        """
+        A hazard that stops leaves a chance of never firing,
+        which a table can't represent.
+        """
+        stopping=gspn.PiecewiseLinearDistribution([0, 1, 2], [1, 0, 0], 0)
+        with self.assertRaises(RuntimeError):
+            gspn.distributions.HazardTable(stopping)
+
+    def test_cache_limit(self):
+        limit=gspn.distributions._hazard_table_limit
+        gspn.distributions._hazard_table_limit=3
+        try:
+            first=gspn.tabulated(gspn.ExponentialDistribution(0.5, 0))
+            for lam in [1.0, 2.0, 3.0]:
+                gspn.tabulated(gspn.ExponentialDistribution(lam, 0))
+            self.assertTrue(len(gspn.distributions._hazard_tables)<=3)
+            again=gspn.tabulated(gspn.ExponentialDistribution(0.5, 0))
+            self.assertIsNot(again.table, first.table)
+            self.assertEqual(again, first)
+        finally:
+            gspn.distributions._hazard_table_limit=limit
+
+
+class TestClosedForm(TestCase):
+    def check(self, dist, cdf, rng):
+        """
+        cdf is the distribution's own CDF, not conditioned on
+        the enabling time.
+        """
+        samples=gspn.distributions.anderson_sample_tester(dist, dist.te,
+            2000, rng)
+        statistic=gspn.distributions.EmpiricalDistribution(
+            samples).compare_theoretical(cdf)
+        self.assertTrue(statistic<1.63)
+        now=dist.te+0.5
+        survival_now=1-cdf(now)
+        for i in range(10):
+            t1=now+rng.uniform(0, 2)
+            self.assertAlmostEqual(dist.hazard_integral(now, t1),
+                np.log(survival_now)-np.log(1-cdf(t1)), places=8)
+        later=np.array([dist.sample(now, rng) for i in range(2000)])
+        self.assertTrue(np.all(later>=now))
+        conditional=lambda t: (cdf(t)-cdf(now))/survival_now
+        statistic=gspn.distributions.EmpiricalDistribution(
+            later).compare_theoretical(conditional)
+        self.assertTrue(statistic<1.63)
+        # The density matches a difference of the conditional CDF.
+        t1=np.median(later)
+        step=1e-5
+        density=(conditional(t1+step)-conditional(t1-step))/(2*step)
+        self.assertAlmostEqual(np.exp(dist.loglikelihood(now, t1)), density,
+            places=4)
+
+    def test_weibull_density(self):
+        dist=gspn.WeibullDistribution(1.5, 2.5, 1.0, 0)
+        cdf=lambda t: 1-np.exp(-np.power(np.maximum(t-1.0, 0)/1.5, 2.5))
+        now=1.5
+        step=1e-5
+        for tf in [1.7, 2.4, 3.9]:
+            density=(cdf(tf+step)-cdf(tf-step))/(2*step)/(1-cdf(now))
+            self.assertAlmostEqual(np.exp(dist.loglikelihood(now, tf)),
+                density, places=5)
+        self.assertEqual(dist.loglikelihood(0.0, 0.5), -float("inf"))
+
+    def test_loglogistic(self):
+        rng=np.random.RandomState(41)
+        dist=gspn.LogLogisticDistribution(1.5, 3.0, 2.0)
+        cdf=lambda t: 1-1/(1+np.power(np.maximum(t-2.0, 0)/1.5, 3.0))
+        self.check(dist, cdf, rng)
+        # Far in the tail, e^xa overflows but the firing time doesn't.
+        late=dist.implicit_hazard_integral(800.0, 3.0)
+        self.assertTrue(np.isfinite(late))
+        self.assertAlmostEqual(dist.hazard_integral(3.0, late)/800.0, 1.0,
+            places=8)
+        self.assertEqual(gspn.LogLogisticDistribution(1.5, 0.5, 2.0
+            ).implicit_hazard_integral(800.0, 3.0), float("inf"))
+
+    def test_gaussian(self):
+        rng=np.random.RandomState(42)
+        dist=gspn.GaussianDistribution(2.0, 0.8, 1.0)
+        below=scipy.stats.norm.cdf(-2.0/0.8)
+        cdf=lambda t: np.maximum(scipy.stats.norm.cdf(t-1.0, 2.0, 0.8)-below,
+            0)/(1-below)
+        self.check(dist, cdf, rng)
+        self.assertTrue(np.isfinite(dist.implicit_hazard_integral(200.0, 1.0)))
+
+    def test_histogram(self):
+        rng=np.random.RandomState(43)
+        edges=[0.0, 1.0, 1.5, 3.0, 4.0]
+        counts=[2, 0, 5, 1]
+        dist=gspn.HistogramDistribution(edges, counts, 0.5)
+        cumulative=np.hstack([[0], np.cumsum(counts)])/np.sum(counts)
+        cdf=lambda t: np.interp(t-0.5, edges, cumulative)
+        self.check(dist, cdf, rng)
+
+    def test_histogram_past_support(self):
+        dist=gspn.HistogramDistribution([0, 1, 2], [0.5, 0.5], 0)
+        self.assertEqual(dist.hazard_integral(0, 3), float("inf"))
+        self.assertEqual(dist.hazard_integral(2.5, 3), 0.0)
+        self.assertEqual(dist.loglikelihood(2.5, 1.5), -float("inf"))
+        rng=np.random.RandomState(44)
+        self.assertEqual(dist.implicit_hazard_integral(1.0, 3.0),
+            float("inf"))
+        self.assertEqual(dist.sample(3.0, rng), float("inf"))
+        for now in [0.0, 0.5, 1.0, 1.9]:
+            self.assertTrue(dist.sample(now, rng)>=now)
+
+
+class TestHazard(TestCase):
+    def test_derivative_of_integral(self):
+        te=1.0
+        distributions=[gspn.ExponentialDistribution(0.7, te),
+            gspn.WeibullDistribution(1.2, 1.8, te, 0),
+            gspn.GammaDistribution(2.5, 1.5, te),
+            gspn.UniformDistribution(0.5, 3.0, te),
+            gspn.LogLogisticDistribution(1.5, 3.0, te),
+            gspn.GaussianDistribution(2.0, 0.8, te),
+            gspn.HistogramDistribution([0, 1, 2, 4], [3, 1, 2], te),
+            gspn.PiecewiseLinearDistribution([0, 1, 3], [0.2, 1.0, 0.5], te),
+            gspn.PiecewiseConstantDistribution([0, 1, 3], [0.2, 1.0, 0.5], te),
+            gspn.tabulated(gspn.GammaDistribution(2.5, 1.5, te))]
+        step=1e-6
+        for dist in distributions:
+            for t in [te+0.7, te+1.6, te+2.2]:
+                numeric=(dist.hazard_integral(te, t+step)-
+                    dist.hazard_integral(te, t-step))/(2*step)
+                self.assertAlmostEqual(dist.hazard(t), numeric, places=4,
+                    msg=type(dist).__name__)
+
+    def test_batch_log_hazard(self):
+        te=0.5
+        t=np.array([0.9, 1.7, 3.2])
+        cases=[(gspn.ExponentialBatch, gspn.ExponentialDistribution(0.7, te)),
+            (gspn.WeibullBatch, gspn.WeibullDistribution(1.2, 1.8, te, 0)),
+            (gspn.GammaBatch, gspn.GammaDistribution(2.5, 1.5, te))]
+        for batch_class, dist in cases:
+            parameters=[getattr(dist, name)
+                for name in batch_class.parameter_names]
+            expected=np.log([dist.hazard(x) for x in t])
+            self.assertTrue(np.allclose(
+                batch_class.log_hazard(*parameters, te, t), expected))
@@ -0,0 +1,50 @@
+from unittest import TestCase
+import logging
+import numpy as np
+import gspn
+from gspn.tests.sir import BuildSIR, RecoverTransition
+from gspn.tests.herd import BuildHerd
+
+logger=logging.getLogger(__file__)
+
+
+class TestLockstepEnsemble(TestCase):
+    def test_sir_trajectories(self):
+        rng=np.random.RandomState(771)
+        net=BuildSIR(10)
+        ensemble=gspn.LockstepEnsemble(net, 50, rng)
+        ensemble.init()
+        trajectories=ensemble.run()
+        self.assertEqual(len(trajectories), 50)
+        for trajectory in trajectories:
+            times=[when for (transition, when) in trajectory]
+            self.assertEqual(times, sorted(times))
+            recovered=[t for (t, when) in trajectory
+                if isinstance(t, RecoverTransition)]
+            self.assertEqual(len(recovered), (len(trajectory)+1)//2)
+        # The net itself is not changed by the ensemble.
+        self.assertEqual(ensemble.compiled.marking().sum(), 11)
+
+    def test_matches_direct_method(self):
+        rng=np.random.RandomState(4411)
+        net, places=BuildHerd(200, 2, 0.01, 1.0)
+        ensemble=gspn.LockstepEnsemble(net, 400, rng)
+        ensemble.init()
+        ensemble.run(end_time=2.0)
+        r_col=net.p.index(places['r'])
+        ensemble_recovered=ensemble.marking[:, r_col].mean()
+
+        direct=list()
+        for i in range(400):
+            net, places=BuildHerd(200, 2, 0.01, 1.0)
+            recovered=list()
+            def observer(transition, when):
+                if when<=2.0 and transition is net.t[1]:
+                    recovered.append(when)
+                return when<=2.0
+            run=gspn.RunnerFSM(gspn.DirectMethod(net, rng), observer)
+            run.init()
+            run.run()
+            direct.append(len(recovered))
+        self.assertAlmostEqual(ensemble_recovered, np.mean(direct),
+            delta=0.15*np.mean(direct)+1)
@@ -0,0 +1,75 @@
+from unittest import TestCase
+import logging
+import numpy as np
+import gspn
+from gspn.tests.sir import BuildSIR
+
+logger=logging.getLogger(__file__)
+
+
+def check_queue(queue, rng, cnt):
+    """
+    Apply random inserts, key changes and deletes to the queue
+    and to a dictionary and check that they agree on the least key.
+    """
+    reference=dict()
+    for step in range(cnt):
+        item=int(rng.randint(0, 200))
+        key=rng.uniform(0, 1)
+        if item in reference:
+            if rng.uniform(0, 1)<0.3:
+                queue.delete(item)
+                del reference[item]
+            else:
+                queue.update(item, key)
+                reference[item]=key
+        else:
+            queue.insert(item, key)
+            reference[item]=key
+        assert(len(queue)==len(reference))
+        if reference:
+            least=min(reference.items(), key=lambda x: x[1])
+            assert(queue.peek()==(least[1], least[0]))
+        if item in reference:
+            assert(queue.key(item)==reference[item])
+
+
+class TestIndexedHeap(TestCase):
+    def test_matches_dictionary(self):
+        rng=np.random.RandomState(2342)
+        check_queue(gspn.IndexedHeap(capacity=4), rng, 3000)
+        check_queue(gspn.PairingHeapQueue(), rng, 3000)
+
+    def test_update(self):
+        heap=gspn.IndexedHeap(capacity=2, arity=2)
+        for item in range(20):
+            heap.insert(item, float(item))
+        heap.update(0, 100.0)
+        heap.update(5, 3.5)
+        extracted=[heap.extract() for i in range(20)]
+        self.assertEqual([x[1] for x in extracted][:6], [1, 2, 3, 5, 4, 6])
+        self.assertEqual(extracted[-1], (100.0, 0))
+        self.assertTrue(heap.empty())
+        self.assertFalse(0 in heap)
+
+    def test_sir_indexed(self):
+        rng=np.random.RandomState(33333)
+        net=BuildSIR(10)
+        sampler=gspn.NextReaction(net, rng, gspn.IndexedHeap())
+        events=list()
+        run=gspn.RunnerFSM(sampler, lambda t, when: events.append(when) or True)
+        run.init()
+        run.run()
+        self.assertTrue(len(events)>=1)
+        self.assertEqual(events, sorted(events))
+
+    def test_pairing_update_reuses_node(self):
+        heap=gspn.pairing_heap.pairing_heap()
+        nodes=[heap.insert((float(i), i)) for i in range(10)]
+        heap.update(nodes[0], (20.0, 0))
+        heap.update(nodes[4], (0.5, 4))
+        heap.update(nodes[7], (30.0, 7))
+        order=[heap.extract() for i in range(len(heap))]
+        self.assertEqual(order[0], (0.5, 4))
+        self.assertEqual(order[-3:], [(9.0, 9), (20.0, 0), (30.0, 7)])
+        self.assertEqual(len(order), 10)
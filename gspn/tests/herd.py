@@ -0,0 +1,86 @@
+import logging
+import gspn
+from gspn.tests.sir import CountPlace
+
+logger=logging.getLogger(__file__)
+
+# An SIR model at the level of a herd, where each place counts
+# the animals in one disease state. Rates follow mass action.
+
+class HerdInfectTransition:
+    def __init__(self, s, i, beta):
+        self.s=s
+        self.i=i
+        self.beta=beta
+
+    def depends(self):
+        return [self.s, self.i]
+
+    def affected(self):
+        return [self.s, self.i]
+
+    def stoichiometry(self):
+        return [(self.s, -1), (self.i, 1)]
+
+    def mass_action(self):
+        return self.beta
+
+    def enabled(self, now):
+        if self.s.count>0 and self.i.count>0:
+            return (True, gspn.ExponentialDistribution(
+                self.beta*self.s.count*self.i.count, now))
+        else:
+            return (False, None)
+
+    def fire(self, now, rng):
+        self.s.count-=1
+        self.i.count+=1
+
+
+class HerdRecoverTransition:
+    def __init__(self, i, r, gamma):
+        self.i=i
+        self.r=r
+        self.gamma=gamma
+
+    def depends(self):
+        return [self.i]
+
+    def affected(self):
+        return [self.i, self.r]
+
+    def stoichiometry(self):
+        return [(self.i, -1), (self.r, 1)]
+
+    def mass_action(self):
+        return self.gamma
+
+    def enabled(self, now):
+        if self.i.count>0:
+            return (True, gspn.ExponentialDistribution(
+                self.gamma*self.i.count, now))
+        else:
+            return (False, None)
+
+    def fire(self, now, rng):
+        self.i.count-=1
+        self.r.count+=1
+
+
+def BuildHerd(susceptible_cnt, infected_cnt, beta, gamma):
+    """
+    beta is the rate per susceptible-infected pair,
+    gamma the recovery rate per infected animal.
+    Places are returned by name, "s", "i" and "r".
+    """
+    net=gspn.LLCP()
+    places=dict()
+    for disease_state in ['s', 'i', 'r']:
+        p=CountPlace(disease_state)
+        places[p.id]=p
+        net.add_place(p)
+    net.add_transition(HerdInfectTransition(places['s'], places['i'], beta))
+    net.add_transition(HerdRecoverTransition(places['i'], places['r'], gamma))
+    places['s'].count=susceptible_cnt
+    places['i'].count=infected_cnt
+    return net, places
@@ -0,0 +1,139 @@
+from unittest import TestCase
+import logging
+import numpy as np
+import gspn
+from gspn.tests.sir import BuildSIR, BuildSIRFamily, CountPlace
+from gspn.tests.sir import RecoverTransition
+from gspn.tests.sample_test import RaceTransition
+import gspn.tests.herd as herd
+
+logger=logging.getLogger(__file__)
+
+
+def observed_trajectory(net, seed):
+    events=list()
+    run=gspn.RunnerFSM(gspn.NextReaction(net, np.random.RandomState(seed)),
+        lambda transition, when: events.append((transition, when)) or True)
+    run.init()
+    run.run()
+    return events
+
+
+class TestLikelihood(TestCase):
+    def test_sir_matches_stepwise(self):
+        net=BuildSIR(30)
+        engine=gspn.LikelihoodEngine(net)
+        events=observed_trajectory(net, 2718)
+        self.assertTrue(len(events)>3)
+        end_time=events[-1][1]+1.0
+        incremental=engine.log_likelihood(events, end_time)
+        self.assertEqual(engine.log_likelihood(events, end_time), incremental)
+
+        # The same sum, charging every enabled transition at every step.
+        net=BuildSIR(30)
+        sampler=gspn.NextReaction(net, np.random.RandomState(1))
+        sampler.init()
+        stepwise=0.0
+        previous=0.0
+        for observed, when in events:
+            transition=net.t[observed._id]
+            stepwise+=sampler.log_likelihood(set([transition]), previous, when)
+            sampler.fire(transition, when)
+            previous=when
+        survival=list()
+        net.enabled_transitions(lambda t, dist, now: survival.append(
+            dist.hazard_integral(previous, end_time)))
+        stepwise-=sum(survival)
+        self.assertAlmostEqual(incremental, stepwise, places=8)
+
+    def test_family_matches_explicit(self):
+        """
+        Members of a family are rebuilt for each replay, and the
+        recorded members are matched to them by key.
+        """
+        individual_cnt=8
+        family_net=BuildSIRFamily(individual_cnt)
+        engine=gspn.LikelihoodEngine(family_net)
+        events=list()
+        def first(transition, when):
+            events.append((transition, when))
+            return len(events)<15
+        run=gspn.RunnerFSM(gspn.NextReaction(family_net,
+            np.random.RandomState(3)), first)
+        run.init()
+        run.run()
+        self.assertEqual(len(events), 15)
+        end_time=events[-1][1]+0.5
+        from_family=engine.log_likelihood(events, end_time)
+        self.assertTrue(np.isfinite(from_family))
+        self.assertEqual(engine.log_likelihood(events, end_time), from_family)
+
+        net=BuildSIR(individual_cnt)
+        explicit=dict()
+        for t in net.t:
+            if isinstance(t, RecoverTransition):
+                explicit[t.i.id]=t
+            else:
+                explicit[(t.i0.id, t.s1.id)]=t
+        translated=list()
+        for transition, when in events:
+            if isinstance(transition, RecoverTransition):
+                translated.append((explicit[transition.i.id], when))
+            else:
+                translated.append((explicit[(transition.i0.id,
+                    transition.s1.id)], when))
+        self.assertAlmostEqual(gspn.LikelihoodEngine(net).log_likelihood(
+            translated, end_time), from_family, places=10)
+
+    def test_weibull_race(self):
+        net=gspn.LLCP()
+        place=CountPlace("token")
+        net.add_place(place)
+        shapes=[(1.0, 2.0), (1.5, 0.7)]
+        for lam, k in shapes:
+            net.add_transition(RaceTransition(place, lam,
+                lambda lam, now, k=k: gspn.WeibullDistribution(lam, k, now, 0)))
+        place.count=1
+        when=0.8
+        engine=gspn.LikelihoodEngine(net)
+        result=engine.log_likelihood([(net.t[1], when)])
+        lam, k=shapes[1]
+        expected=np.log(k/lam*(when/lam)**(k-1))
+        for lam, k in shapes:
+            expected-=(when/lam)**k
+        self.assertAlmostEqual(result, expected, places=10)
+        self.assertEqual(engine.log_likelihood([(net.t[0], 0.5),
+            (net.t[1], 0.9)]), -np.inf)
+
+
+HERD_NOMINAL=np.array([0.02, 0.5])
+
+
+def herd_parameters(batch_class, transition, parameter, theta):
+    """
+    Infection is transition 0 and recovery transition 1, and the
+    rate of each is proportional to its rate constant.
+    """
+    return [parameter[0]*theta[:, transition]/HERD_NOMINAL[transition]]
+
+
+class TestTrajectoryRecord(TestCase):
+    def test_matches_replay(self):
+        net, places=herd.BuildHerd(40, 3, *HERD_NOMINAL)
+        observed=observed_trajectory(net, 1414)
+        events=[(t._id, when) for (t, when) in observed]
+        self.assertTrue(len(events)>10)
+        net, places=herd.BuildHerd(40, 3, *HERD_NOMINAL)
+        record=gspn.record_trajectory(net,
+            [(net.t[tid], when) for (tid, when) in events], end_time=100.0)
+        theta=np.array([HERD_NOMINAL, [0.01, 0.5], [0.03, 0.2], [0.02, 1.1]])
+        vectorized=record.log_likelihood(theta, herd_parameters)
+        self.assertEqual(vectorized.shape, (4,))
+        for row_idx in range(theta.shape[0]):
+            net, places=herd.BuildHerd(40, 3, *theta[row_idx])
+            engine=gspn.LikelihoodEngine(net)
+            expected=engine.log_likelihood(
+                [(net.t[tid], when) for (tid, when) in events], 100.0)
+            self.assertAlmostEqual(vectorized[row_idx], expected, places=8)
+        pooled=record.log_likelihood(theta, herd_parameters, workers=2)
+        self.assertTrue(np.allclose(pooled, vectorized))
@@ -1,30 +1,343 @@
 from unittest import TestCase
 import logging
+import time
 import numpy as np
-import sample
-import sir
-import runner
+import gspn
+from gspn.tests import sir
+from gspn.tests import herd
+from gspn.tests.sample_test import RaceTransition
 
 logger = logging.getLogger(__file__)
 
 def observer(transition, when):
-    if 'i' in transition.place.keys():
-        print("Recover {0} {1}".format(transition.place['i'].id, when))
+    if isinstance(transition, sir.RecoverTransition):
+        print("Recover {0} {1}".format(transition.i.id, when))
     else:
-        print("Infect {0} {1}".format(transition.place['s'].id, when))
+        print("Infect {0} {1}".format(transition.s1.id, when))
     return True
 
 def test_sir():
     rng=np.random.RandomState()
     rng.seed(33333)
     net=sir.BuildSIR(10)
-    sampler=sample.NextReaction(net, rng)
-    run=runner.RunnerFSM(sampler, observer)
+    sampler=gspn.NextReaction(net, rng)
+    run=gspn.RunnerFSM(sampler, observer)
     run.init()
     run.run()
 
 
+class DetectTransition:
+    """
+    Surveillance notices an infected herd at a constant rate.
+    """
+    def __init__(self, i):
+        self.i=i
+
+    def depends(self):
+        return [self.i]
+
+    def affected(self):
+        return []
+
+    def enabled(self, now):
+        if self.i.count>0:
+            return (True, gspn.ExponentialDistribution(0.1, now))
+        else:
+            return (False, None)
+
+    def fire(self, now, rng):
+        pass
+
+
+def trajectory(net, seed):
+    events=list()
+    def record(transition, when):
+        events.append((transition._id, when))
+        return True
+    run=gspn.RunnerFSM(gspn.NextReaction(net, np.random.RandomState(seed)),
+        record)
+    run.init()
+    run.run()
+    return events
+
+
 class TestSIR(TestCase):
     def test_sir_runs(self):
         logging.basicConfig(level=logging.DEBUG)
         test_sir()
+
+    def test_freeze_same_trajectory(self):
+        for seed in [1, 2, 3]:
+            net=sir.BuildSIR(12)
+            expected=trajectory(net, seed)
+            net=sir.BuildSIR(12)
+            net.freeze()
+            self.assertFalse(hasattr(net.p[0], "_adjacency"))
+            self.assertEqual(trajectory(net, seed), expected)
+
+    def test_freeze_arrays(self):
+        net=sir.BuildSIR(3)
+        net.freeze()
+        # Each individual's infected place is read by its recovery
+        # and by the two infections it can cause.
+        i_place=net.p[1]
+        begin, end=net._place_offset[1], net._place_offset[2]
+        self.assertEqual(end-begin, 3)
+        for tid in net._place_transition[begin:end]:
+            self.assertTrue(i_place in net.t[tid].depends())
+        self.assertRaises(RuntimeError, net.add_place, sir.CountPlace("x"))
+
+    def test_enabled_index(self):
+        rng=np.random.RandomState(8)
+        net=sir.BuildSIR(6)
+        sampler=gspn.NextReaction(net, rng)
+        sampler.init()
+        for step in range(8):
+            listed=list()
+            net.enabled_transitions(lambda t, dist, now: listed.append(t._id))
+            scanned=[t._id for t in net.t if t._distribution is not None]
+            self.assertEqual(sorted(listed), scanned)
+            transition, when=sampler.next()
+            if transition is None:
+                break
+            sampler.fire(transition, when)
+
+    def test_unchanged_distributions_elided(self):
+        rng=np.random.RandomState(21)
+        net, places=herd.BuildHerd(50, 5, 0.05, 1.0)
+        net.add_transition(DetectTransition(places['i']))
+        reports=list()
+        sampler=gspn.NextReaction(net, rng)
+        observe=sampler._observe
+        def counting(transition, olddist, newdist, firing, now):
+            reports.append(transition)
+            observe(transition, olddist, newdist, firing, now)
+        sampler._observe=counting
+        run=gspn.RunnerFSM(sampler, lambda t, when: True)
+        run.init()
+        run.run()
+        # Detection's hazard doesn't depend on how many are infected,
+        # so only its first enabling and its firings are reported.
+        detect=net.t[2]
+        detect_reports=[t for t in reports if t is detect]
+        self.assertTrue(net.elided_updates>0)
+        self.assertTrue(len(detect_reports)<len(reports)/4)
+
+
+def final_size(net, sampler, seed):
+    run=gspn.RunnerFSM(sampler(net, np.random.RandomState(seed)),
+        lambda t, when: True)
+    run.init()
+    run.run()
+    return sum(p.count for p in net.p if p.id[1]=='r')
+
+
+class TestFamily(TestCase):
+    def test_members_only_while_enabled(self):
+        individual_cnt=30
+        net=sir.BuildSIRFamily(individual_cnt)
+        rng=np.random.RandomState(55)
+        largest=[0]
+        def check(transition, when):
+            infected=sum(p.count for p in net.p if p.id[1]=='i')
+            susceptible=sum(p.count for p in net.p if p.id[1]=='s')
+            live=len(net.t)-individual_cnt-len(net._free)
+            self.assertEqual(live, infected*susceptible)
+            self.assertEqual(len(net._enabled), live+infected)
+            largest[0]=max(largest[0], len(net.t))
+            return True
+        run=gspn.RunnerFSM(gspn.NextReaction(net, rng), check)
+        run.init()
+        run.run()
+        self.assertTrue(largest[0]<individual_cnt*individual_cnt/2)
+
+    def test_same_as_explicit(self):
+        family=[final_size(sir.BuildSIRFamily(12), gspn.NextReaction, seed)
+            for seed in range(300)]
+        explicit=[final_size(sir.BuildSIR(12), gspn.NextReaction, seed+1000)
+            for seed in range(300)]
+        error=np.sqrt(np.var(family)/300+np.var(explicit)/300)
+        self.assertTrue(abs(np.mean(family)-np.mean(explicit))<4*error)
+        for sampler in [gspn.FirstReaction, gspn.DirectMethod,
+                gspn.CompositionRejection]:
+            self.assertTrue(final_size(sir.BuildSIRFamily(12), sampler, 8)>=1)
+
+    def test_frozen_snapshot(self):
+        net=sir.BuildSIRFamily(15)
+        net.freeze()
+        sampler=gspn.NextReaction(net, np.random.RandomState(3))
+        sampler.init()
+        for step_idx in range(4):
+            sampler.fire(*sampler.next())
+        snapshot=sampler.snapshot()
+        rng_state=sampler.rng.get_state()
+        continuations=list()
+        for attempt in range(2):
+            sampler.restore(snapshot)
+            sampler.rng.set_state(rng_state)
+            events=list()
+            run=gspn.RunnerFSM(sampler,
+                lambda t, when: events.append((t._key if "_key" in t.__dict__
+                else t._id, when)) or True)
+            run.run()
+            continuations.append(events)
+        self.assertTrue(len(continuations[0])>0)
+        self.assertEqual(continuations[0], continuations[1])
+
+
+class TestLump(TestCase):
+    def test_sir_lumped(self):
+        individual_cnt=12
+        net=sir.BuildSIR(individual_cnt)
+        self.assertEqual(net.lump(), 2*individual_cnt)
+        self.assertEqual(len([t for t in net.t
+            if isinstance(t, gspn.LumpedTransition)]), individual_cnt)
+        largest=[0]
+        sampler=gspn.NextReaction(net, np.random.RandomState(12))
+        def check(transition, when):
+            largest[0]=max(largest[0], len(sampler.priority))
+            return True
+        run=gspn.RunnerFSM(sampler, check)
+        run.init()
+        run.run()
+        self.assertTrue(largest[0]<=2*individual_cnt)
+
+        def lumped(seed, sampler, freeze):
+            net=sir.BuildSIR(individual_cnt)
+            net.lump()
+            if freeze:
+                net.freeze()
+            return final_size(net, sampler, seed)
+        sizes=[lumped(seed, gspn.NextReaction, seed%2) for seed in range(300)]
+        explicit=[final_size(sir.BuildSIR(individual_cnt), gspn.NextReaction,
+            seed+1000) for seed in range(300)]
+        error=np.sqrt(np.var(sizes)/300+np.var(explicit)/300)
+        self.assertTrue(abs(np.mean(sizes)-np.mean(explicit))<4*error)
+        self.assertTrue(lumped(5, gspn.DirectMethod, True)>=1)
+
+    def test_member_choice(self):
+        """
+        Members fire in proportion to their rates, and disabled
+        members never fire.
+        """
+        rates=[1.0, 2.0, 5.0, 3.0, 4.0]
+        places=[sir.CountPlace(idx) for idx in range(len(rates))]
+        for place in places:
+            place.count=1
+        places[2].count=0
+        lumped=gspn.LumpedTransition([RaceTransition(place, rate)
+            for (place, rate) in zip(places, rates)])
+        self.assertEqual(lumped.enabled(0.0)[1].lam, 10.0)
+        rng=np.random.RandomState(21)
+        chosen=np.zeros(len(rates))
+        for draw_idx in range(10000):
+            lumped.fire(0.0, rng)
+            chosen[lumped.members.index(lumped.last_fired)]+=1
+            lumped.last_fired.place.count=1
+        self.assertEqual(chosen[2], 0)
+        for idx in [0, 1, 3, 4]:
+            self.assertAlmostEqual(chosen[idx]/10000, rates[idx]/10.0,
+                delta=0.015)
+        places[0].count=0
+        lumped.touch(0)
+        self.assertEqual(lumped.enabled(0.0)[1].lam, 9.0)
+        places[4].count=0
+        places[3].count=0
+        places[1].count=0
+        for idx in [1, 3, 4]:
+            lumped.touch(idx)
+        self.assertEqual(lumped.enabled(0.0), (False, None))
+
+    def test_touch_cost(self):
+        """
+        Asking one member again costs about the same in a large group
+        as in a small one, so lumping many transitions isn't slower
+        than leaving them apart.
+        """
+        def touch_time(member_cnt):
+            places=[sir.CountPlace(idx) for idx in range(member_cnt)]
+            for place in places:
+                place.count=1
+            lumped=gspn.LumpedTransition([RaceTransition(place, 1.0)
+                for place in places])
+            lumped.enabled(0.0)
+            best=float("inf")
+            for repeat_idx in range(5):
+                start=time.process_time()
+                for touch_idx in range(1000):
+                    places[0].count=1-places[0].count
+                    lumped.touch(0)
+                    lumped.enabled(0.0)
+                best=min(best, time.process_time()-start)
+            return best
+        self.assertTrue(touch_time(100000)<4*touch_time(10))
+
+    def test_other_engines(self):
+        """
+        TauLeaping uses the members' shared stoichiometry, while
+        CompiledNet and lumping non-exponential members fail at once.
+        """
+        individual_cnt=20
+        net=sir.BuildSIR(individual_cnt)
+        net.lump()
+        fired=[0]
+        def tally(firings, when):
+            fired[0]+=sum(firings.values())
+            return True
+        engine=gspn.TauLeaping(net, np.random.RandomState(8), tally)
+        engine.init()
+        engine.run()
+        recovered=sum(p.count for p in net.p if p.id[1]=='r')
+        self.assertEqual(sum(p.count for p in net.p if p.id[1]=='i'), 0)
+        self.assertEqual(fired[0], 2*recovered-1)
+        with self.assertRaises(RuntimeError):
+            gspn.CompiledNet(net)
+
+        mixed=sir.BuildSIR(4)
+        mixed.lump(key=lambda t: t.affected()[0].id[0])
+        with self.assertRaises(RuntimeError):
+            [t.stoichiometry() for t in mixed.t]
+
+        place=sir.CountPlace("token")
+        place.count=1
+        weibull=gspn.LLCP()
+        weibull.add_place(place)
+        for rate in [1.0, 2.0]:
+            weibull.add_transition(RaceTransition(place, rate,
+                lambda lam, now: gspn.WeibullDistribution(lam, 2.0, now, 0)))
+        with self.assertRaises(RuntimeError):
+            weibull.lump()
+
+    def test_restore_fires_enabled_member(self):
+        """
+        After restoring a snapshot, a lumped transition chooses among
+        members enabled in the restored marking, not in the branch
+        that was abandoned.
+        """
+        lumped_cnt=0
+        for seed in range(40):
+            net=sir.BuildSIR(12)
+            net.lump()
+            sampler=gspn.NextReaction(net, np.random.RandomState(seed))
+            steps=[0]
+            def first_three(transition, when):
+                steps[0]+=1
+                return steps[0]<3
+            sampler.init()
+            gspn.RunnerFSM(sampler, first_three).run()
+            snapshot=sampler.snapshot()
+            gspn.RunnerFSM(sampler, lambda transition, when: True).run()
+            sampler.restore(snapshot, resample=True)
+            transition, when=sampler.next()
+            if transition is None:
+                continue
+            before=sum(p.count for p in net.p)
+            if isinstance(transition, gspn.LumpedTransition):
+                lumped_cnt+=1
+                enabled=[m for m in transition.members if m.enabled(when)[0]]
+                sampler.fire(transition, when)
+                self.assertTrue(transition.last_fired in enabled)
+            else:
+                sampler.fire(transition, when)
+            self.assertEqual(sum(p.count for p in net.p), before)
+        self.assertTrue(lumped_cnt>0)
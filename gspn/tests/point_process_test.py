@@ -0,0 +1,42 @@
+from unittest import TestCase
+import logging
+import numpy as np
+import gspn
+
+logger=logging.getLogger(__file__)
+
+
+class TestPointProcess(TestCase):
+    def test_poisson_intensity(self):
+        rng=np.random.default_rng(31)
+        bounds=(0, 20, -5, 5)
+        counts=[gspn.poisson_point_process_2D(3.0, bounds, rng).shape[0]
+            for i in range(200)]
+        self.assertAlmostEqual(np.mean(counts), 600, delta=6)
+        points=gspn.poisson_point_process_2D(3.0, bounds, rng)
+        self.assertTrue(np.all(points[:, 0]>=0) and np.all(points[:, 0]<=20))
+        self.assertTrue(np.all(points[:, 1]>=-5) and np.all(points[:, 1]<=5))
+
+    def test_clusters(self):
+        rng=np.random.default_rng(32)
+        bounds=(0, 100, 0, 100)
+        thomas=gspn.thomas_point_process_2D(0.05, 0.5, 20, bounds, rng)
+        matern=gspn.matern_point_process_2D(0.05, 1.0, 20, bounds, rng)
+        for points in [thomas, matern]:
+            self.assertEqual(points.shape[1], 2)
+            self.assertAlmostEqual(points.shape[0]/(0.05*100*100*20), 1.0,
+                delta=0.15)
+
+    def test_tiles(self):
+        parameters=(0.05, 1.0, 20)
+        bounds=(0, 95, 0, 60)
+        tiles=list(gspn.tiled_point_process_2D(gspn.matern_point_process_2D,
+            parameters, bounds, 20.0, 5))
+        self.assertEqual(len(tiles), 5*3)
+        self.assertEqual(tiles[-1][0], (80.0, 95, 40.0, 60))
+        again=dict(gspn.tiled_point_process_2D(gspn.matern_point_process_2D,
+            parameters, bounds, 20.0, 5))
+        for tile_bounds, points in tiles:
+            self.assertTrue(np.array_equal(again[tile_bounds], points))
+        total=sum(points.shape[0] for (b, points) in tiles)
+        self.assertAlmostEqual(total/(0.05*95*60*20), 1.0, delta=0.15)
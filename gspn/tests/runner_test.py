@@ -0,0 +1,36 @@
+from unittest import TestCase
+import functools
+import logging
+import gspn
+from gspn.tests.sir import BuildSIR, RecoverTransition
+
+logger=logging.getLogger(__file__)
+
+
+class FinalSize:
+    """
+    Records how many individuals recovered and when the last did.
+    """
+    def __init__(self):
+        self.recovered=0
+        self.last=0.0
+
+    def __call__(self, transition, when):
+        if isinstance(transition, RecoverTransition):
+            self.recovered+=1
+            self.last=when
+        return True
+
+    def summary(self):
+        return (self.recovered, self.last)
+
+
+class TestReplicateRunner(TestCase):
+    def test_independent_of_workers(self):
+        runner=gspn.ReplicateRunner(functools.partial(BuildSIR, 8), FinalSize)
+        one=runner.run(12, 20151104, workers=1)
+        three=runner.run(12, 20151104, workers=3)
+        self.assertEqual(one, three)
+        self.assertEqual(len(set(one)), 12)
+        other=runner.run(12, 20151105, workers=2)
+        self.assertNotEqual(one, other)
@@ -0,0 +1,200 @@
+from unittest import TestCase
+import logging
+import numpy as np
+import gspn
+import gspn.fenwick
+from gspn.tests.sir import BuildSIR, CountPlace
+
+logger=logging.getLogger(__file__)
+
+
+class RaceTransition:
+    """
+    Fires once, at a constant rate, if its place holds a token.
+    Fire removes the token, so the first transition to fire wins.
+    """
+    def __init__(self, place, rate, distribution=gspn.ExponentialDistribution):
+        self.place=place
+        self.rate=rate
+        self.distribution=distribution
+
+    def depends(self):
+        return [self.place]
+
+    def affected(self):
+        return [self.place]
+
+    def enabled(self, now):
+        if self.place.count>0:
+            return (True, self.distribution(self.rate, now))
+        else:
+            return (False, None)
+
+    def fire(self, now, rng):
+        self.place.count=0
+
+
+def BuildRace(rates):
+    net=gspn.LLCP()
+    place=CountPlace("token")
+    net.add_place(place)
+    for rate in rates:
+        net.add_transition(RaceTransition(place, rate))
+    place.count=1
+    return net
+
+
+def race_winners(sampler_class, rates, cnt, rng):
+    winners=np.zeros(len(rates))
+    total_time=0.0
+    for i in range(cnt):
+        net=BuildRace(rates)
+        sampler=sampler_class(net, rng)
+        sampler.init()
+        transition, when=sampler.next()
+        sampler.fire(transition, when)
+        winners[net.t.index(transition)]+=1
+        total_time+=when
+        assert(sampler.next()[0] is None)
+    return winners/cnt, total_time/cnt
+
+
+class TestFenwick(TestCase):
+    def test_find(self):
+        tree=gspn.fenwick.FenwickTree(11)
+        weights=[0, 2, 0, 1, 5, 0, 0, 3, 0, 1, 0]
+        for idx, w in enumerate(weights):
+            tree.set(idx, w)
+        self.assertEqual(tree.total(), 12)
+        cumulative=np.cumsum(weights)
+        for u in np.linspace(0, 11.99, 200):
+            self.assertEqual(tree.find(u),
+                np.searchsorted(cumulative, u, side="right"))
+        tree.set(4, 0)
+        tree.rebuild()
+        self.assertEqual(tree.total(), 7)
+        self.assertEqual(tree.find(3.5), 7)
+
+
+class TestSamplers(TestCase):
+    def test_race_probabilities(self):
+        rng=np.random.RandomState(9234)
+        rates=[1.0, 3.0]
+        for sampler_class in [gspn.FirstReaction, gspn.NextReaction,
+                gspn.DirectMethod, gspn.CompositionRejection]:
+            fraction, mean_time=race_winners(sampler_class, rates, 4000, rng)
+            self.assertAlmostEqual(fraction[0], 0.25, delta=0.03)
+            self.assertAlmostEqual(mean_time, 0.25, delta=0.02)
+
+    def test_composition_rejection_spread_rates(self):
+        rng=np.random.RandomState(2221)
+        rates=[0.05, 0.2, 0.7, 1.0, 1.9, 4.5]
+        fraction, mean_time=race_winners(gspn.CompositionRejection,
+            rates, 10000, rng)
+        expected=np.array(rates)/sum(rates)
+        self.assertTrue(np.all(np.abs(fraction-expected)<0.01))
+
+    def test_direct_sir(self):
+        rng=np.random.RandomState(33333)
+        net=BuildSIR(10)
+        events=list()
+        run=gspn.RunnerFSM(gspn.DirectMethod(net, rng),
+            lambda t, when: events.append(when) or True)
+        run.init()
+        run.run()
+        self.assertTrue(len(events)>=1)
+        self.assertEqual(events, sorted(events))
+
+    def test_direct_rejects_weibull(self):
+        net=gspn.LLCP()
+        place=CountPlace("token")
+        net.add_place(place)
+        net.add_transition(RaceTransition(place, 1.0,
+            lambda rate, now: gspn.WeibullDistribution(rate, 2.0, now, 0)))
+        place.count=1
+        sampler=gspn.DirectMethod(net, np.random.RandomState(3))
+        self.assertRaises(RuntimeError, sampler.init)
+
+
+class TestBufferedRandom(TestCase):
+    def test_reproducible(self):
+        draws=list()
+        for attempt in range(2):
+            rng=gspn.BufferedRandom(np.random.default_rng(77), block=16)
+            draws.append([rng.uniform(0, 1) for i in range(40)]+
+                [rng.exponential(2.0) for i in range(40)]+
+                list(rng.normal(size=3)))
+        self.assertEqual(draws[0], draws[1])
+        expected=np.random.default_rng(77).uniform(0, 1, 48)[:40]
+        self.assertTrue(np.allclose(draws[0][:40], expected))
+
+    def test_race_probabilities(self):
+        rng=gspn.BufferedRandom(np.random.RandomState(9235))
+        for sampler_class in [gspn.FirstReaction, gspn.NextReaction,
+                gspn.DirectMethod, gspn.CompositionRejection]:
+            fraction, mean_time=race_winners(sampler_class, [1.0, 3.0],
+                4000, rng)
+            self.assertAlmostEqual(fraction[0], 0.25, delta=0.03)
+            self.assertAlmostEqual(mean_time, 0.25, delta=0.02)
+
+
+class TestNextReactionState(TestCase):
+    def test_transitions_carry_no_sampler_state(self):
+        rng=np.random.RandomState(4321)
+        net=BuildSIR(10)
+        before=[set(t.__dict__.keys()) for t in net.t]
+        sampler=gspn.NextReaction(net, rng)
+        run=gspn.RunnerFSM(sampler, lambda t, when: True)
+        run.init()
+        run.run()
+        self.assertEqual([set(t.__dict__.keys()) for t in net.t], before)
+        self.assertFalse(np.any(sampler.queued))
+
+
+def continue_run(sampler, step_cnt=None):
+    events=list()
+    while step_cnt is None or len(events)<step_cnt:
+        transition, when=sampler.next()
+        if transition is None:
+            break
+        sampler.fire(transition, when)
+        events.append((transition._id, when))
+    return events
+
+
+class TestSnapshot(TestCase):
+    def test_replay(self):
+        samplers=[gspn.FirstReaction, gspn.NextReaction,
+            lambda net, rng: gspn.NextReaction(net, rng, gspn.IndexedHeap()),
+            gspn.DirectMethod, gspn.CompositionRejection]
+        for sampler_class in samplers:
+            rng=np.random.RandomState(5150)
+            net=BuildSIR(20)
+            sampler=sampler_class(net, rng)
+            sampler.init()
+            continue_run(sampler, 5)
+            snapshot=sampler.snapshot()
+            marking=[p.count for p in net.p]
+            rng_state=rng.get_state()
+            first=continue_run(sampler)
+            self.assertTrue(len(first)>0)
+            sampler.restore(snapshot)
+            self.assertEqual([p.count for p in net.p], marking)
+            rng.set_state(rng_state)
+            self.assertEqual(continue_run(sampler), first)
+
+    def test_resample(self):
+        rng=np.random.RandomState(5151)
+        net=BuildSIR(20)
+        sampler=gspn.NextReaction(net, rng)
+        sampler.init()
+        continue_run(sampler, 5)
+        snapshot=sampler.snapshot()
+        start=net.current_time()
+        branches=list()
+        for branch_idx in range(10):
+            sampler.restore(snapshot, resample=True)
+            events=continue_run(sampler)
+            self.assertTrue(events[0][1]>=start)
+            branches.append(events)
+        self.assertTrue(len(set(tuple(b) for b in branches))>1)
@@ -21,6 +21,12 @@ class RecoverTransition:
     def affected(self):
         return [self.i, self.r]
 
+    def stoichiometry(self):
+        return [(self.i, -1), (self.r, 1)]
+
+    def mass_action(self):
+        return 1.0
+
     def enabled(self, now):
         if self.i.count>0:
             return (True, gspn.ExponentialDistribution(1.0, now))
@@ -44,6 +50,12 @@ class InfectTransition:
     def affected(self):
         return [self.s1, self.i1]
 
+    def stoichiometry(self):
+        return [(self.s1, -1), (self.i1, 1)]
+
+    def mass_action(self):
+        return 0.5
+
     def enabled(self, now):
         if self.i0.count>0 and self.s1.count>0:
             return (True, gspn.ExponentialDistribution(0.5, now))
@@ -88,6 +100,54 @@ def BuildSIR(individual_cnt):
     return net
 
 
+class InfectFamily(gspn.TransitionFamily):
+    """
+    Infection of every individual by every other, as one family,
+    with keys (source, target).
+    """
+    def __init__(self, places, individual_cnt):
+        self.places=places
+        self.individual_cnt=individual_cnt
+
+    def candidates(self, place):
+        idx, disease_state=place.id
+        if place.count==0:
+            return list()
+        if disease_state=='i':
+            return [(idx, j) for j in range(self.individual_cnt)
+                if self.places[(j, 's')].count>0]
+        elif disease_state=='s':
+            return [(j, idx) for j in range(self.individual_cnt)
+                if self.places[(j, 'i')].count>0]
+        return list()
+
+    def instance(self, key):
+        source, target=key
+        return InfectTransition(self.places[(source, 'i')],
+            self.places[(target, 's')], self.places[(target, 'i')])
+
+
+def BuildSIRFamily(individual_cnt):
+    """
+    The same model as BuildSIR, with infections as a TransitionFamily.
+    """
+    net=gspn.LLCP()
+    places=dict()
+    for add_idx in range(individual_cnt):
+        for disease_state in ['s', 'i', 'r']:
+            p=CountPlace((add_idx, disease_state))
+            places[p.id]=p
+            net.add_place(p)
+    for internal_idx in range(individual_cnt):
+        net.add_transition(RecoverTransition(places[(internal_idx, 'i')],
+            places[(internal_idx, 'r')]))
+    net.add_family(InfectFamily(places, individual_cnt))
+    places[(0, 'i')].count=1
+    for s_idx in range(1, individual_cnt):
+        places[(s_idx, 's')].count=1
+    return net
+
+
 ########################################
 # This is the part that runs the SIR
 def observer(transition, when):
@@ -0,0 +1,89 @@
+from unittest import TestCase
+import logging
+import numpy as np
+import gspn
+
+logger=logging.getLogger(__file__)
+
+
+class TestSpatial(TestCase):
+    def test_pairs_match_brute_force(self):
+        rng=np.random.default_rng(61)
+        points=gspn.poisson_point_process_2D(2.0, (0, 10, 0, 10), rng)
+        source, target, distance=gspn.neighbor_pairs(points, 1.0)
+        found=set(zip(source.tolist(), target.tolist()))
+        expected=set()
+        for a in range(len(points)):
+            for b in range(len(points)):
+                if a!=b and np.linalg.norm(points[a]-points[b])<=1.0:
+                    expected.add((a, b))
+        self.assertEqual(found, expected)
+        self.assertTrue(np.all(distance<=1.0))
+
+    def test_kernel_sir(self):
+        rng=np.random.default_rng(62)
+        points=gspn.poisson_point_process_2D(1.0, (0, 30, 0, 30), rng)
+        kernel=lambda d: 0.8*np.exp(-d)
+        net, places=gspn.BuildKernelSIR(points, kernel, 2.0, 0.5, [0])
+        source, target, distance=gspn.neighbor_pairs(points, 2.0)
+        self.assertEqual(len(net.t), len(points)+len(source))
+        events=list()
+        run=gspn.RunnerFSM(gspn.NextReaction(net, rng, gspn.IndexedHeap()),
+            lambda transition, when: events.append(transition) or True)
+        run.init()
+        run.run()
+        counts=np.array([[p.count for p in row] for row in places])
+        self.assertTrue(np.all(counts.sum(axis=1)==1))
+        self.assertEqual(counts[:, 1].sum(), 0)
+        self.assertEqual(counts[:, 2].sum(), 1+len(events)//2)
+
+    def test_grid_matches_pairwise(self):
+        """
+        Thinning the grid's candidate events gives the same process
+        as a transition for every pair, so mean final sizes agree.
+        """
+        rng=np.random.default_rng(63)
+        points=gspn.poisson_point_process_2D(1.0, (0, 8, 0, 8), rng)
+        kernel=lambda d: 0.6*np.exp(-d)
+        sizes=list()
+        for build in [gspn.BuildKernelSIR, gspn.BuildGridKernelSIR]:
+            final=list()
+            for run_idx in range(200):
+                if build is gspn.BuildKernelSIR:
+                    net, places=build(points, kernel, 3.0, 1.0, [0])
+                else:
+                    net, places=build(points, kernel, 1.5, 1.0, [0], 3.0)
+                run=gspn.RunnerFSM(gspn.NextReaction(net, rng),
+                    lambda transition, when: True)
+                run.init()
+                run.run()
+                if build is gspn.BuildKernelSIR:
+                    final.append(sum(row[2].count for row in places))
+                else:
+                    final.append(sum(len(p[2].units)
+                        for p in places.values()))
+            sizes.append(np.array(final))
+        error=np.sqrt(sizes[0].var()/200+sizes[1].var()/200)
+        self.assertTrue(abs(sizes[0].mean()-sizes[1].mean())<4*error)
+        self.assertTrue(sizes[1].mean()>1.5)
+
+    def test_grid_accepted(self):
+        """
+        Accepted candidates are exactly the infections, and the rest
+        of the infection firings are rejected candidates.
+        """
+        rng=np.random.default_rng(64)
+        points=gspn.poisson_point_process_2D(1.0, (0, 10, 0, 10), rng)
+        kernel=lambda d: 0.6*np.exp(-d)
+        net, places=gspn.BuildGridKernelSIR(points, kernel, 2.0, 1.0, [0])
+        tally={True : 0, False : 0}
+        def observer(transition, when):
+            if isinstance(transition, gspn.spatial.CellInfectTransition):
+                tally[transition.accepted]+=1
+            return True
+        run=gspn.RunnerFSM(gspn.NextReaction(net, rng), observer)
+        run.init()
+        run.run()
+        infected=sum(len(p[1].units)+len(p[2].units) for p in places.values())
+        self.assertEqual(tally[True], infected-1)
+        self.assertTrue(tally[False]>0)
@@ -0,0 +1,75 @@
+from unittest import TestCase
+import logging
+import numpy as np
+import gspn
+from gspn.tests.sir import CountPlace
+
+logger=logging.getLogger(__file__)
+
+
+class StepTransition:
+    """
+    Moves a random walk on the count of a place by one,
+    at a constant rate, while the count is positive.
+    """
+    def __init__(self, place, step, rate):
+        self.place=place
+        self.step=step
+        self.rate=rate
+
+    def depends(self):
+        return [self.place]
+
+    def affected(self):
+        return [self.place]
+
+    def enabled(self, now):
+        if self.place.count>0:
+            return (True, gspn.ExponentialDistribution(self.rate, now))
+        else:
+            return (False, None)
+
+    def fire(self, now, rng):
+        self.place.count+=self.step
+
+
+def BuildWalk(up, down):
+    net=gspn.LLCP()
+    place=CountPlace("walker")
+    net.add_place(place)
+    net.add_transition(StepTransition(place, 1, up))
+    net.add_transition(StepTransition(place, -1, down))
+    place.count=1
+    return net, place
+
+
+class TestSplitting(TestCase):
+    def test_gamblers_ruin(self):
+        """
+        The chance that the walk reaches top before zero
+        is (1-r)/(1-r^top), for r=down/up.
+        """
+        rng=np.random.RandomState(818)
+        net, place=BuildWalk(1.0, 2.0)
+        top=12
+        splitting=gspn.FixedEffortSplitting(net, rng,
+            lambda system: place.count, list(range(2, top+1)), 500)
+        estimate=splitting.run()
+        exact=(1-2.0)/(1-2.0**top)
+        self.assertEqual(len(splitting.level_probability), top-1)
+        self.assertTrue(splitting.variance>0)
+        self.assertTrue(abs(estimate-exact)<3*np.sqrt(splitting.variance))
+
+    def test_direct_method(self):
+        """
+        Any sampler with snapshot and restore can drive the splitting.
+        """
+        rng=np.random.RandomState(819)
+        net, place=BuildWalk(1.0, 2.0)
+        top=8
+        splitting=gspn.FixedEffortSplitting(net, rng,
+            lambda system: place.count, list(range(2, top+1)), 500,
+            sampler=gspn.DirectMethod(net, rng))
+        estimate=splitting.run()
+        exact=(1-2.0)/(1-2.0**top)
+        self.assertTrue(abs(estimate-exact)<3*np.sqrt(splitting.variance))
@@ -0,0 +1,136 @@
+from unittest import TestCase
+import logging
+import numpy as np
+import gspn
+from gspn.tests.herd import BuildHerd
+from gspn.tests.sir import BuildSIRFamily, CountPlace
+
+logger=logging.getLogger(__file__)
+
+
+class Tally:
+    def __init__(self, limit=None):
+        self.limit=limit
+        self.leaps=0
+        self.firings=dict()
+        self.when=list()
+
+    def __call__(self, firings, when):
+        self.leaps+=1
+        for transition, cnt in firings.items():
+            name=type(transition).__name__
+            self.firings[name]=self.firings.get(name, 0)+cnt
+        self.when.append(when)
+        return self.limit is None or self.leaps<self.limit
+
+
+class InfectionCheck(Tally):
+    """
+    Checks that each infection that fired infected its own target.
+    """
+    def __init__(self, test):
+        Tally.__init__(self)
+        self.test=test
+
+    def __call__(self, firings, when):
+        for transition, cnt in firings.items():
+            if hasattr(transition, "s1"):
+                self.test.assertEqual(cnt, 1)
+                self.test.assertEqual(transition.s1.count, 0)
+        return Tally.__call__(self, firings, when)
+
+
+class TickTransition:
+    """
+    Always enabled, and changes no counts.
+    """
+    def __init__(self, place):
+        self.place=place
+
+    def depends(self):
+        return [self.place]
+
+    def affected(self):
+        return list()
+
+    def stoichiometry(self):
+        return list()
+
+    def enabled(self, now):
+        return (True, gspn.ExponentialDistribution(1.0, now))
+
+    def fire(self, now, rng):
+        return list()
+
+
+class TestTauLeaping(TestCase):
+    def test_recovery_mean(self):
+        """
+        With no susceptibles, the infected decay at rate gamma.
+        """
+        rng=np.random.RandomState(1234)
+        remaining=list()
+        for i in range(20):
+            net, places=BuildHerd(0, 10000, 0.0, 1.0)
+            tally=Tally()
+            engine=gspn.TauLeaping(net, rng, tally, end_time=1.0)
+            engine.init()
+            engine.run()
+            self.assertEqual(tally.when, sorted(tally.when))
+            self.assertTrue(tally.leaps<1000)
+            self.assertEqual(places['i'].count+places['r'].count, 10000)
+            self.assertEqual(tally.firings["HerdRecoverTransition"],
+                places['r'].count)
+            remaining.append(places['i'].count)
+        self.assertAlmostEqual(np.mean(remaining)/10000, np.exp(-1), delta=0.01)
+
+    def test_outbreak_finishes_exactly(self):
+        rng=np.random.RandomState(5678)
+        net, places=BuildHerd(5000, 10, 0.0004, 1.0)
+        tally=Tally()
+        engine=gspn.TauLeaping(net, rng, tally)
+        engine.init()
+        engine.run()
+        self.assertEqual(places['i'].count, 0)
+        self.assertEqual(places['s'].count+places['r'].count, 5010)
+        self.assertTrue(places['s'].count>=0)
+        self.assertEqual(tally.firings["HerdRecoverTransition"],
+            places['r'].count)
+
+    def test_reused_id(self):
+        """
+        Leaping a family, whose members take the ids of released
+        transitions, moves the tokens of the member that fired.
+        """
+        individual_cnt=12
+        for seed in range(10):
+            net=BuildSIRFamily(individual_cnt)
+            tally=InfectionCheck(self)
+            engine=gspn.TauLeaping(net, np.random.RandomState(seed), tally,
+                exact_threshold=0)
+            engine.init()
+            engine.run()
+            self.assertTrue(tally.leaps>0)
+            for idx in range(individual_cnt):
+                self.assertEqual(sum(net.p[3*idx+offset].count
+                    for offset in range(3)), 1)
+            self.assertEqual(tally.firings.get("InfectTransition", 0),
+                sum(net.p[3*idx+2].count for idx in range(individual_cnt))-1)
+
+    def test_no_count_changes(self):
+        """
+        Transitions that change no counts can't bound a leap, so
+        the engine steps exactly instead of leaping forever.
+        """
+        place=CountPlace("token")
+        place.count=1
+        net=gspn.LLCP()
+        net.add_place(place)
+        net.add_transition(TickTransition(place))
+        tally=Tally(limit=25)
+        engine=gspn.TauLeaping(net, np.random.RandomState(7), tally)
+        engine.init()
+        engine.run()
+        self.assertEqual(tally.leaps, 25)
+        self.assertEqual(tally.firings["TickTransition"], 25)
+        self.assertEqual(place.count, 1)